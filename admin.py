@@ -1,42 +1,42 @@
 from flask import render_template, url_for, request
 from flask_login import current_user
+from sqlalchemy.orm import selectinload, joinedload
 from werkzeug.utils import redirect
 
+import helper.admin_helper as admin_helper
+import helper.derangement as derangement
 import helper.generic_helper as helper
+import helper.mail_helper as mail_helper
+import helper.snapshot_helper as snapshot_helper
+import helper.user_helper as user_helper
 from db_handler import db_session
 from models import Round, Question, User, Participation, Description
 
 
 def handle_admin():
-    rounds = db_session.query(Round).all()
+    rounds = db_session.query(Round).options(selectinload(Round.questions)).all()
     questions = db_session.query(Question).all()
 
     users = db_session.query(User).all()
     current_round = next(filter(lambda cur_round: cur_round.running, rounds), None)
 
     participations = []
+    delivery_status = {}
     if current_round is not None:
         for question in questions:
             question.in_cur_round = question in current_round.questions
             question.in_use = question.in_cur_round or any([(question in a_round.questions) for a_round in rounds])
  
-        participations = db_session.query(Participation).filter(Participation.round_id == current_round.id).all()
-        for participation in participations:
-            unanswered = []
-            for question in current_round.questions:
-                answer = helper.get_answer(participation.description_id,
-                        question.id)
-                if answer is None or answer.text.isspace():
-                    unanswered.append(question.text)
-            participation.description.unanswered = unanswered
-            participation.description.is_filled = len(unanswered) == 0
+        participations = admin_helper.load_participations(current_round)
+        delivery_status = mail_helper.get_delivery_status(current_round.id)
 
     shall_shuffle = all([participation.description.is_filled for participation in participations]) \
-                    and not any([participation.other_description for participation in participations])
+                    and not any([participation.other_description_id for participation in participations])
 
     return render_template('admin.html', active=1, is_admin=True,
                            rounds=rounds,
                            participations=participations,
+                           delivery_status=delivery_status,
                            shall_shuffle=shall_shuffle,
                            current_round=current_round,
                            questions=questions,
@@ -54,6 +54,7 @@ def handle_edit_user():
         elif action == 'delete':
             db_session.delete(user)
             db_session.commit()
+        user_helper.invalidate_user(user.email)
 
     return redirect(url_for('admin'))
 
@@ -69,9 +70,12 @@ def handle_edit_question():
         else:
             cur_round.questions.append(question)
 
+        helper.invalidate_cur_round()
         db_session.commit()
+        snapshot_helper.invalidate_snapshot(cur_round.id)
     elif action == 'delete':
         db_session.delete(question)
+        helper.invalidate_cur_round()
         db_session.commit()
 
     return redirect(url_for('admin'))
@@ -83,19 +87,40 @@ def handle_edit_round(action):
     if action == 'add':
         if cur_round is None:
             db_session.add(Round())
+            helper.invalidate_cur_round()
             db_session.commit()
     elif action == 'stop':
         if cur_round is not None:
             cur_round.running = False
+            helper.invalidate_cur_round()
             db_session.commit()
+            snapshot_helper.write_snapshot(cur_round)
     elif action == 'shuffle':
         if cur_round is not None:
-            participations = helper.get_cur_participations(cur_round.id)
-            random_indizes = helper.random_derangement(len(participations))
+            participations = db_session.query(Participation).options(
+                joinedload(Participation.description)
+            ).filter(Participation.round_id == cur_round.id).all()
+            # Drawing again would reassign everybody and mail them twice
+            if len(participations) < 2 or any(participation.other_description_id
+                                               for participation in participations):
+                return redirect(url_for('admin'))
+
+            recipients = [participation.description.user_id for participation in participations]
+            positions = {user_id: index for index, user_id in enumerate(recipients)}
+            forbidden = {(positions[giver], positions[receiver])
+                         for giver, receiver in helper.get_previous_pairings(cur_round.id)
+                         if giver in positions and receiver in positions}
+            try:
+                random_indizes = derangement.constrained_derangement(len(participations), forbidden)
+            except ValueError:
+                random_indizes = derangement.random_derangement(len(participations))
+
             for index in range(len(participations)):
-                participations[index].other_description = participations[random_indizes[index]].description
+                participations[index].other_description_id = participations[random_indizes[index]].description_id
 
             db_session.commit()
+            snapshot_helper.write_snapshot(cur_round)
+            mail_helper.send_assignment_mails(cur_round.id, recipients)
     return redirect(url_for('admin'))
 
 
@@ -106,8 +131,7 @@ def handle_edit_participation(action):
         if cur_round is not None:
             participation = Participation(
                 cur_round=cur_round,
-                description=Description(
-                    user=current_user)
+                description=Description(user_id=current_user.email)
             )
 
             db_session.add(participation)
@@ -119,7 +143,11 @@ def handle_edit_participation(action):
             return redirect(url_for('index'))
 
         part_id = request.args.get('id')
-        db_session.query(Participation).filter(Participation.id == part_id).delete()
-        db_session.commit()
+        participation = db_session.query(Participation).filter(Participation.id == part_id).first()
+        if participation is not None:
+            round_id = participation.round_id
+            db_session.delete(participation)
+            db_session.commit()
+            snapshot_helper.invalidate_snapshot(round_id)
 
         return redirect(url_for('admin'))
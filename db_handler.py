@@ -1,35 +1,104 @@
-import pyclbr
-import sys
-
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+
+# Execution option naming the BEGIN mode of a SQLite transaction, e.g. 'IMMEDIATE'
+SQLITE_BEGIN = 'sqlite_begin'
+
+
+def configure_sqlite(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        dbapi_connection = connection.connection.connection
+        mode = connection.get_execution_options().get(SQLITE_BEGIN)
+        if mode is None:
+            # pysqlite begins right before the first write, so reads never hold
+            # a snapshot that a concurrent writer could invalidate
+            dbapi_connection.isolation_level = ''
+        else:
+            # SQLAlchemy emits BEGIN itself, which makes DDL and savepoints transactional
+            dbapi_connection.isolation_level = None
+            connection.execute('BEGIN {}'.format(mode))
+
+
+def begin_immediate(session):
+    """Starts the transaction of session with the write lock already taken.
+
+    Meant for short units of work that write and need savepoints or
+    transactional DDL on SQLite. Other backends ignore the option.
+    """
+    session.connection(execution_options={SQLITE_BEGIN: 'IMMEDIATE'})
+
+
+def lock_for_write(session):
+    """Takes the SQLite write lock for the rest of the transaction of session.
 
-engine = create_engine('sqlite:///database.db', convert_unicode=True)
+    Unlike begin_immediate it may follow reads, pysqlite runs those outside
+    of a transaction. Other backends ignore it, lock the rows instead.
+    """
+    connection = session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.connection.in_transaction:
+        connection.execute('BEGIN IMMEDIATE')
+
+
+def make_engine(url, sqlite_pragmas=None, **options):
+    """Creates an engine with pool settings suited to its backend.
+
+    SQLite connections get the given pragmas on connect, file databases
+    are pooled so the pragmas, page cache and memory map are kept between
+    requests.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            options.setdefault('poolclass', StaticPool)
+        else:
+            options.setdefault('poolclass', QueuePool)
+            options.setdefault('pool_size', 5)
+            options.setdefault('max_overflow', 10)
+        options.setdefault('connect_args', {'check_same_thread': False})
+    else:
+        options.setdefault('pool_size', 10)
+        options.setdefault('max_overflow', 20)
+        options.setdefault('pool_recycle', 1800)
+        options.setdefault('pool_pre_ping', True)
+
+    engine = create_engine(url, **options)
+    if url.get_backend_name() == 'sqlite':
+        configure_sqlite(engine, sqlite_pragmas or {})
+    return engine
+
+
+# Created by init_engine once the app config is loaded
+engine = None
 db_session = scoped_session(sessionmaker(autocommit=False,
-                                         autoflush=False,
-                                         bind=engine))
+                                         autoflush=False))
 Base = declarative_base()
 Base.query = db_session.query_property()
 
 
+def init_engine(config):
+    global engine
+
+    if engine is not None:
+        db_session.remove()
+        engine.dispose()
+    engine = make_engine(config['DATABASE_URL'], config['SQLITE_PRAGMAS'], **config['DATABASE_POOL_OPTIONS'])
+    db_session.configure(bind=engine)
+    return engine
+
+
 def init_db():
-    import models
-    from sqlalchemy import Table
-
-    for class_name in pyclbr.readmodule(models.__name__).keys():
-        try:
-            table_class = getattr(sys.modules[models.__name__], class_name)
-            if not table_class.__table__.exists(bind=engine):
-                table_class.__table__.create(bind=engine)
-                db_session.commit()
-        except AttributeError:
-            pass
-
-    for table_object in [class_object for class_object in models.__dict__.values() if type(class_object) == Table]:
-        try:
-            if not table_object.exists(bind=engine):
-                table_object.create(bind=engine)
-                db_session.commit()
-        except AttributeError:
-            pass
+    import migrations
+
+    migrations.migrate(engine)
@@ -1,14 +1,13 @@
-import os
-import uuid
-
-from flask import url_for, request
+from flask import url_for, request, current_app, flash
+from flask_babel import gettext
 from flask_wtf import FlaskForm
 from werkzeug.utils import redirect
 
-from config import ALLOWED_EXTENSIONS
-from db_handler import db_session
-from helper.generic_helper import get_answer, get_cur_round, get_cur_participation, print_errors
-from models import Answer, Question
+from db_handler import db_session, lock_for_write
+from helper.generic_helper import get_answers, get_cur_round, get_cur_participation, print_errors
+from helper.media_helper import store_media
+from helper.snapshot_helper import invalidate_snapshot
+from models import Answer, Description
 
 
 def file_suffix(filename):
@@ -16,7 +15,22 @@ def file_suffix(filename):
 
 
 def allowed_file(filename):
-    return '.' in filename and file_suffix(filename) in ALLOWED_EXTENSIONS
+    return '.' in filename and file_suffix(filename) in current_app.config['ALLOWED_EXTENSIONS']
+
+
+def get_or_create_answer(answers, new_answers, description, question):
+    if question is None:
+        return None
+
+    answer = answers.get(question.id)
+    if answer is None:
+        # Inserted in one batch by the caller, so only the foreign keys are set
+        answer = Answer()
+        answer.description_id = description.id
+        answer.question_id = question.id
+        answers[question.id] = answer
+        new_answers.append(answer)
+    return answer
 
 
 def handle_description_form(config):
@@ -32,35 +46,40 @@ def handle_description_form(config):
     if form.validate_on_submit():
         form = request.form
         files = request.files
+        description = cur_participation.description
+        # Saves racing for the same description, e.g. a double click, would insert the same answers
+        lock_for_write(db_session)
+        db_session.query(Description.id).filter(Description.id == description.id).with_for_update().one()
+        questions = {str(question.id): question for question in cur_round.questions}
+        answers = get_answers([description.id], [question.id for question in cur_round.questions])
+        answers = answers.get(description.id, {})
+        new_answers = []
+
         for question in [question for question in form if question.startswith('question')]:
             if form[question] != '':
-                q_id = question.rsplit('_', 1)[1]
-                answer = get_answer(cur_participation.description.id, q_id)
-                if answer is None:
-                    cur_question = db_session.query(Question).filter(Question.id == q_id).first()
-                    answer = Answer(description=cur_participation.description, question=cur_question)
-                    db_session.add(answer)
-
-                answer.text = form[question]
-                db_session.commit()
+                answer = get_or_create_answer(answers, new_answers, description,
+                                              questions.get(question.rsplit('_', 1)[1]))
+                if answer is not None and answer.text != form[question]:
+                    answer.text = form[question]
 
         for file_field in files:
             u_file = files[file_field]
             if u_file.filename != '':
-                q_id = file_field.rsplit('_', 1)[1]
-                answer = get_answer(cur_participation.description.id, q_id)
+                if not allowed_file(u_file.filename):
+                    flash(gettext(u"%(filename)s was not saved, this file type is not supported.",
+                                  filename=u_file.filename))
+                    continue
+
+                answer = get_or_create_answer(answers, new_answers, description,
+                                              questions.get(file_field.rsplit('_', 1)[1]))
                 if answer is None:
-                    cur_question = db_session.query(Question).filter(Question.id == q_id).first()
-                    answer = Answer(description=cur_participation.description, question=cur_question)
-                    db_session.add(answer)
+                    continue
 
-                filename = str(uuid.uuid4())
-                new_filename = "{}.{}".format(filename, file_suffix(u_file.filename))
-                file_path = os.path.join(config['UPLOAD_FOLDER'], new_filename)
-                u_file.save(file_path)
+                answer.text = store_media(config['UPLOAD_FOLDER'], u_file, file_suffix(u_file.filename))
 
-                answer.text = new_filename
-                db_session.commit()
+        db_session.bulk_save_objects(new_answers)
+        db_session.commit()
+        invalidate_snapshot(cur_round.id)
 
     else:
         print_errors(form)
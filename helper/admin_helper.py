@@ -0,0 +1,25 @@
+from sqlalchemy.orm import joinedload
+
+from db_handler import db_session
+from helper.generic_helper import get_answers
+from models import Participation, Description
+
+
+def load_participations(cur_round):
+    participations = db_session.query(Participation).options(
+        joinedload(Participation.description).joinedload(Description.user)
+    ).filter(Participation.round_id == cur_round.id).all()
+
+    answers = get_answers([participation.description_id for participation in participations],
+                          [question.id for question in cur_round.questions])
+
+    for participation in participations:
+        unanswered = []
+        for question in cur_round.questions:
+            answer = answers.get(participation.description_id, {}).get(question.id)
+            if answer is None or answer.text.isspace():
+                unanswered.append(question.text)
+        participation.description.unanswered = unanswered
+        participation.description.is_filled = len(unanswered) == 0
+
+    return participations
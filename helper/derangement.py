@@ -0,0 +1,102 @@
+import random
+from collections import deque
+
+# How many unconstrained samples are drawn before falling back to matching
+SAMPLE_ATTEMPTS = 32
+
+
+def _derangement_ratios(n):
+    # d[k] = D(k) / k! where D(k) is the number of derangements of k elements
+    d = [1.0, 0.0]
+    factorial = 1.0
+    for k in range(2, n + 1):
+        factorial *= k
+        d.append(d[k - 1] + (-1) ** k / factorial)
+    return d
+
+
+def random_derangement(n, rng=random):
+    """Returns a uniformly distributed derangement of range(n) as a tuple.
+
+    Uses the early refusal algorithm of Martinez, Panholzer and Prodinger,
+    which needs expected linear time instead of restarting a whole
+    Fisher-Yates shuffle on every fixed point.
+    """
+    if n == 1:
+        raise ValueError('There is no derangement of a single element.')
+
+    d = _derangement_ratios(n)
+    values = list(range(n))
+    marked = [False] * n
+    i = n - 1
+    unmarked = n
+    while unmarked >= 2:
+        if not marked[i]:
+            while True:
+                j = rng.randrange(i)
+                if not marked[j]:
+                    break
+            values[i], values[j] = values[j], values[i]
+            # Probability that i and j close a 2-cycle: (u - 1) D(u - 2) / D(u)
+            if rng.random() < d[unmarked - 2] / (unmarked * d[unmarked]):
+                marked[j] = True
+                unmarked -= 1
+            unmarked -= 1
+        i -= 1
+    return tuple(values)
+
+
+def _matching(n, forbidden, rng):
+    target_of = [-1] * n
+    source_of = [-1] * n
+    sources = list(range(n))
+    rng.shuffle(sources)
+
+    for source in sources:
+        candidates = list(range(n))
+        rng.shuffle(candidates)
+        parent = {}
+        queue = deque([source])
+        free_target = None
+        while queue and free_target is None:
+            i = queue.popleft()
+            for j in candidates:
+                if j == i or j in parent or (i, j) in forbidden:
+                    continue
+                parent[j] = i
+                if source_of[j] == -1:
+                    free_target = j
+                    break
+                queue.append(source_of[j])
+
+        if free_target is None:
+            raise ValueError('The constraints do not allow any derangement.')
+
+        j = free_target
+        while j != -1:
+            i = parent[j]
+            previous = target_of[i]
+            target_of[i] = j
+            source_of[j] = i
+            j = previous
+
+    return tuple(target_of)
+
+
+def constrained_derangement(n, forbidden=frozenset(), rng=random):
+    """Returns a derangement of range(n) avoiding all (i, j) pairs in forbidden.
+
+    Uniform derangements are sampled first. Should the constraints reject
+    all of them, a perfect matching over the allowed pairs is searched,
+    which is no longer uniform but always finds a solution if one exists.
+    Raises ValueError if there is none.
+    """
+    if len(forbidden) == 0:
+        return random_derangement(n, rng)
+
+    for _ in range(SAMPLE_ATTEMPTS):
+        values = random_derangement(n, rng)
+        if not any((i, j) in forbidden for i, j in enumerate(values)):
+            return values
+
+    return _matching(n, forbidden, rng)
@@ -0,0 +1,44 @@
+import math
+import random
+
+from db_handler import db_session
+from helper.generic_helper import build_descriptions
+from helper.snapshot_helper import read_snapshot, write_snapshot
+from models import Participation
+
+
+def get_gallery_seed(session):
+    if 'gallery_seed' not in session:
+        session['gallery_seed'] = random.getrandbits(32)
+    return session['gallery_seed']
+
+
+def gallery_order(description_ids, seed):
+    description_ids = sorted(description_ids)
+    random.Random(seed).shuffle(description_ids)
+    return description_ids
+
+
+def get_gallery_page(a_round, seed, page, page_size):
+    """Returns the descriptions on the given page of the shuffled gallery and the number of pages.
+
+    Closed rounds and drawn rounds are served from their snapshot, running
+    rounds are built from the database.
+    """
+    snapshot = read_snapshot(a_round.id)
+    if snapshot is None and not a_round.running:
+        snapshot = write_snapshot(a_round)
+
+    if snapshot is None:
+        description_ids = [row.description_id for row in db_session.query(Participation.description_id).filter(
+            Participation.round_id == a_round.id
+        ).all()]
+    else:
+        descriptions = {entry['description_id']: entry['description'] for entry in snapshot}
+        description_ids = list(descriptions)
+    pages = max(1, math.ceil(len(description_ids) / page_size))
+
+    page_ids = gallery_order(description_ids, seed)[page * page_size:(page + 1) * page_size]
+    if snapshot is None:
+        return build_descriptions(a_round.questions, page_ids), pages
+    return [descriptions[description_id] for description_id in page_ids], pages
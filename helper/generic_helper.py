@@ -1,33 +1,45 @@
-import random
+from functools import lru_cache
 
-from flask import flash
-from flask_babel import gettext
+from flask import flash, g
+from flask_babel import gettext, lazy_gettext
 from flask_login import current_user
-from sqlalchemy import and_
+from sqlalchemy.orm import Session, selectinload, aliased
 from wtforms import StringField, FileField
 
 from db_handler import db_session
 from forms import DescriptionForm, Length
-from models import Participation, Round, Answer
+from models import Participation, Round, Answer, Description, Setting
 
+# Number of per-round description form classes kept around
+FORM_CACHE_SIZE = 16
 
-def build_description_form(current_round, description):
-    form = DescriptionForm
-
-    for question in current_round.questions:
-        answer = get_answer(description.id, question.id)
-        answer_text = '' if answer is None else answer.text
-        if question.q_type == 'text':
-            field = StringField(question.text,
-                                render_kw={"placeholder": gettext('Type your answer here.')},
-                                default=answer_text, description=question.q_type,
+
+@lru_cache(maxsize=FORM_CACHE_SIZE)
+def description_form_class(round_id, questions):
+    """Builds the form class for a round once per set of (id, text, type) question tuples."""
+    fields = {}
+    for question_id, text, q_type in questions:
+        if q_type == 'text':
+            field = StringField(text,
+                                render_kw={"placeholder": lazy_gettext('Type your answer here.')},
+                                description=q_type,
                                 validators=[Length(max=256)])
         else:
-            field = FileField(question.text, default=answer_text, description=question.q_type)
+            field = FileField(text, description=q_type)
+
+        fields['question_{}'.format(question_id)] = field
 
-        setattr(form, 'question_{}'.format(question.id), field)
+    return type('DescriptionForm{}'.format(round_id), (DescriptionForm,), fields)
+
+
+def build_description_form(current_round, description):
+    questions = tuple((question.id, question.text, question.q_type) for question in current_round.questions)
+    answers = get_answers([description.id], [question.id for question in current_round.questions])
+    answers = answers.get(description.id, {})
 
-    return form()
+    form = description_form_class(current_round.id, questions)
+    return form(data={'question_{}'.format(question_id): answer.text
+                      for question_id, answer in answers.items()})
 
 
 def get_cur_participations(cur_rounds_id):
@@ -35,33 +47,73 @@ def get_cur_participations(cur_rounds_id):
 
 
 def get_cur_participation(cur_rounds_id):
-    participations = db_session.query(Participation).filter(Participation.round_id == cur_rounds_id).all()
-    participation = next(
-        filter(lambda part: part.description.user_id == current_user.email,
-                participations), None)
-    return participation
+    memo = g.setdefault('cur_participations', {})
+    if cur_rounds_id not in memo:
+        memo[cur_rounds_id] = db_session.query(Participation).join(
+            Description, Participation.description_id == Description.id
+        ).filter(
+            Participation.round_id == cur_rounds_id,
+            Description.user_id == current_user.email
+        ).first()
+    return memo[cur_rounds_id]
+
+
+ROUND_VERSION = 'round_version'
+
+# (round version, detached current round) shared by all requests of this process
+_cur_round_cache = (None, None)
+
+
+def get_round_version():
+    setting = db_session.query(Setting).get(ROUND_VERSION)
+    return 0 if setting is None else setting.value
+
+
+def invalidate_cur_round():
+    updated = db_session.query(Setting).filter(Setting.key == ROUND_VERSION).update(
+        {Setting.value: Setting.value + 1}, synchronize_session=False)
+    if updated == 0:
+        db_session.add(Setting(ROUND_VERSION, 1))
+    g.pop('cur_round', None)
+
+
+def _load_cur_round():
+    session = Session(bind=db_session.get_bind(), expire_on_commit=False)
+    try:
+        return session.query(Round).options(selectinload(Round.questions)).filter(Round.running).first()
+    finally:
+        session.close()
 
 
 def get_cur_round():
-    cur_rounds = db_session.query(Round).filter(Round.running).all()
+    global _cur_round_cache
 
-    if len(cur_rounds) > 0:
-        return cur_rounds[0]
-    else:
-        return None
+    if 'cur_round' not in g:
+        version = get_round_version()
+        cached_version, cur_round = _cur_round_cache
+        if cached_version != version:
+            cur_round = _load_cur_round()
+            _cur_round_cache = (version, cur_round)
 
+        g.cur_round = None if cur_round is None else db_session.merge(cur_round, load=False)
+    return g.cur_round
 
-def get_answers_for_description(description_id):
-    return db_session.query(Answer).filter(
-        Answer.description_id == description_id,
-    ).all()
 
+def get_answers(description_ids, question_ids):
+    description_ids = list(description_ids)
+    question_ids = list(question_ids)
+    if len(description_ids) == 0 or len(question_ids) == 0:
+        return {}
 
-def get_answer(description_id, question_id):
-    return db_session.query(Answer).filter(and_(
-        Answer.description_id == description_id,
-        Answer.question_id == question_id
-    )).first()
+    answers = db_session.query(Answer).filter(
+        Answer.description_id.in_(description_ids),
+        Answer.question_id.in_(question_ids)
+    ).all()
+
+    result = {}
+    for answer in answers:
+        result.setdefault(answer.description_id, {})[answer.question_id] = answer
+    return result
 
 
 def print_errors(form):
@@ -73,21 +125,26 @@ def print_errors(form):
 
 
 def build_description(questions, description_id):
-    return [{
+    return build_descriptions(questions, [description_id])[0]
+
+
+def build_descriptions(questions, description_ids):
+    answers = get_answers(description_ids, [question.id for question in questions])
+    return [[{
         'question': question,
-        'answer': get_answer(description_id, question.id)
-    } for question in questions]
-
-
-def random_derangement(n):
-    while True:
-        v = list(range(n))
-        for j in range(n - 1, -1, -1):
-            p = random.randint(0, j)
-            if v[p] == j:
-                break
-            else:
-                v[j], v[p] = v[p], v[j]
-        else:
-            if v[0] != 0:
-                return tuple(v)
+        'answer': answers.get(description_id, {}).get(question.id)
+    } for question in questions] for description_id in description_ids]
+
+
+def get_previous_pairings(cur_rounds_id):
+    previous_round = db_session.query(Round).filter(Round.id < cur_rounds_id).order_by(Round.id.desc()).first()
+    if previous_round is None:
+        return set()
+
+    giver = aliased(Description)
+    receiver = aliased(Description)
+    return set(db_session.query(giver.user_id, receiver.user_id).select_from(Participation).join(
+        giver, Participation.description_id == giver.id
+    ).join(
+        receiver, Participation.other_description_id == receiver.id
+    ).filter(Participation.round_id == previous_round.id).all())
@@ -1,17 +1,50 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+from threading import Thread, Event
+
 from flask import url_for, render_template
-from flask_mail import Message
+
+from db_handler import db_session
+from models import QueuedMail
+
+SENDER = "secret@santa.com"
+
+# Wakes the worker of this process as soon as a mail has been queued
+_mail_queued = Event()
+
+
+def send_mail(address, subject, html):
+    db_session.add(QueuedMail(address, subject, html))
+    db_session.commit()
+    _mail_queued.set()
+
+
+def send_mails(queued_mails):
+    db_session.add_all(queued_mails)
+    db_session.commit()
+    _mail_queued.set()
 
 
-def send_mail(mail, address, subject, html):
-    with mail.connect() as conn:
-        msg = Message(subject,
-                sender="secret@santa.com",
-                recipients=[address])
-        msg.html = html
-        conn.send(msg)
+def send_assignment_mails(round_id, addresses):
+    subject = "The lots have been drawn!"
 
+    index_url = url_for('index', _external=True)
 
-def send_reset_mail(mail, address, token):
+    send_mails([QueuedMail(address, subject, render_template(
+        'email/assignment.html',
+        address=address,
+        index_url=index_url), round_id) for address in addresses])
+
+
+def get_delivery_status(round_id):
+    # The latest mail of a recipient wins
+    return dict(db_session.query(QueuedMail.recipient, QueuedMail.status).filter(
+        QueuedMail.round_id == round_id
+    ).order_by(QueuedMail.id).all())
+
+
+def send_reset_mail(address, token):
     subject = "Want to reset your password?"
 
     reset_url = url_for(
@@ -23,4 +56,109 @@ def send_reset_mail(mail, address, token):
         'email/reset_link.html',
         reset_url=reset_url)
 
-    send_mail(mail, address, subject, html)
+    send_mail(address, subject, html)
+
+
+def claim_mails(limit, lease):
+    now = datetime.utcnow()
+    token = str(uuid.uuid4())
+    due = db_session.query(QueuedMail.id).filter(
+        QueuedMail.status.in_(['queued', 'sending']),
+        QueuedMail.next_attempt_at <= now
+    ).order_by(QueuedMail.id).limit(limit).subquery()
+
+    # A mail stuck in 'sending' belongs to a dead worker once its lease is over
+    db_session.query(QueuedMail).filter(
+        QueuedMail.id.in_(db_session.query(due.c.id)),
+        QueuedMail.status.in_(['queued', 'sending']),
+        QueuedMail.next_attempt_at <= now
+    ).update({
+        QueuedMail.status: 'sending',
+        QueuedMail.claimed_by: token,
+        QueuedMail.next_attempt_at: now + timedelta(seconds=lease)
+    }, synchronize_session=False)
+    db_session.commit()
+
+    return db_session.query(QueuedMail).filter(QueuedMail.claimed_by == token).order_by(QueuedMail.id).all()
+
+
+def _retry_later(queued_mail, error, max_attempts, backoff):
+    queued_mail.attempts += 1
+    queued_mail.last_error = str(error)[:512]
+    if queued_mail.attempts >= max_attempts:
+        queued_mail.status = 'failed'
+    else:
+        queued_mail.status = 'queued'
+        queued_mail.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff * 2 ** (queued_mail.attempts - 1))
+
+
+def deliver_mails(mail, queued_mails, max_attempts, backoff, rate_limit=0):
+    from flask_mail import Message
+
+    interval = 1.0 / rate_limit if rate_limit > 0 else 0
+    try:
+        with mail.connect() as conn:
+            for index, queued_mail in enumerate(queued_mails):
+                if index > 0 and interval > 0:
+                    time.sleep(interval)
+                msg = Message(queued_mail.subject,
+                        sender=SENDER,
+                        recipients=[queued_mail.recipient])
+                msg.html = queued_mail.html
+                try:
+                    conn.send(msg)
+                except Exception as error:
+                    _retry_later(queued_mail, error, max_attempts, backoff)
+                else:
+                    queued_mail.status = 'sent'
+                    queued_mail.sent_at = datetime.utcnow()
+    except Exception as error:
+        # The connection itself failed, every mail not yet sent has to wait
+        for queued_mail in queued_mails:
+            if queued_mail.status == 'sending':
+                _retry_later(queued_mail, error, max_attempts, backoff)
+
+    db_session.commit()
+
+
+def drain_queue(mail, config):
+    queued_mails = claim_mails(config['MAIL_QUEUE_BATCH_SIZE'], config['MAIL_QUEUE_LEASE'])
+    if len(queued_mails) > 0:
+        deliver_mails(mail, queued_mails, config['MAIL_QUEUE_MAX_ATTEMPTS'], config['MAIL_QUEUE_BACKOFF'],
+                      config['MAIL_QUEUE_RATE_LIMIT'])
+    return len(queued_mails)
+
+
+class MailWorker(Thread):
+
+    def __init__(self, app, mail):
+        super(MailWorker, self).__init__(name='mail-worker', daemon=True)
+        self.app = app
+        self.mail = mail
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.app.app_context():
+                try:
+                    sent = drain_queue(self.mail, self.app.config)
+                except Exception:
+                    self.app.logger.exception('Draining the mail queue failed')
+                    db_session.rollback()
+                    sent = 0
+                finally:
+                    db_session.remove()
+
+            if sent == 0:
+                _mail_queued.wait(self.app.config['MAIL_QUEUE_INTERVAL'])
+                _mail_queued.clear()
+
+    def stop(self):
+        self.stopped.set()
+        _mail_queued.set()
+
+
+def start_mail_worker(app, mail):
+    worker = MailWorker(app, mail)
+    worker.start()
+    return worker
@@ -0,0 +1,256 @@
+import glob
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app, request, abort
+from sqlalchemy import func
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+from db_handler import db_session
+from helper.upload_helper import UploadStream, store_upload, media_kind
+from models import Answer, Question
+
+# Files younger than this are never collected, their answer may not be committed yet
+GC_GRACE_PERIOD = 60 * 60
+
+DERIVATIVE_FOLDER = 'derivatives'
+IMAGE_WIDTHS = (320, 640, 1280)
+IMAGE_QUALITY = 80
+
+SOUND_BITRATE = '96k'
+PREVIEW_BITRATE = '64k'
+PREVIEW_SECONDS = 30
+TRANSCODE_TIMEOUT = 10 * 60
+
+logger = logging.getLogger(__name__)
+_derivative_pool = ThreadPoolExecutor(max_workers=2)
+
+
+def is_shard(name):
+    return len(name) == 2 and all(char in '0123456789abcdef' for char in name)
+
+
+def content_name(digest, suffix):
+    return '{}/{}/{}.{}'.format(digest[:2], digest[2:4], digest, suffix)
+
+
+def file_digest(u_file):
+    if isinstance(u_file.stream, UploadStream):
+        return u_file.stream.digest.hexdigest()
+
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: u_file.stream.read(64 * 1024), b''):
+        digest.update(chunk)
+    u_file.stream.seek(0)
+    return digest.hexdigest()
+
+
+def store_media(upload_folder, u_file, suffix):
+    """Stores an uploaded file under the hash of its content and returns its name.
+
+    Files with the same content share one copy on disk.
+    """
+    name = content_name(file_digest(u_file), suffix)
+    file_path = os.path.join(upload_folder, name)
+    if os.path.exists(file_path):
+        u_file.close()
+        # Restarts the grace period so a pending collection keeps the file,
+        # its derivatives were scheduled by the upload which stored it
+        os.utime(file_path)
+    else:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        store_upload(u_file, file_path)
+        schedule_derivatives(upload_folder, name)
+    return name
+
+
+def derivative_name(name, label, extension):
+    return '{}/{}.{}.{}'.format(DERIVATIVE_FOLDER, name.rsplit('.', 1)[0], label, extension)
+
+
+@lru_cache(maxsize=None)
+def image_extension():
+    """Returns the format of the image renditions, None if Pillow is not installed."""
+    try:
+        from PIL import features
+    except ImportError:
+        return None
+    return 'webp' if features.check('webp') else 'jpg'
+
+
+def _save_atomically(file_path, save):
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    # Unique per job, so concurrent jobs for the same rendition never write into one file
+    handle, part_path = tempfile.mkstemp(dir=directory, prefix='.derivative-', suffix='.part')
+    os.close(handle)
+    try:
+        save(part_path)
+        os.chmod(part_path, 0o644)
+        os.replace(part_path, file_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def build_image_derivatives(upload_folder, name):
+    """Renders the image at every width of IMAGE_WIDTHS below its own width."""
+    extension = image_extension()
+    if extension is None:
+        return
+
+    from PIL import Image, ImageOps
+    with Image.open(os.path.join(upload_folder, name)) as source:
+        source = ImageOps.exif_transpose(source).convert('RGB')
+        for width in IMAGE_WIDTHS:
+            if width >= source.width:
+                break
+            file_path = os.path.join(upload_folder, derivative_name(name, 'w{}'.format(width), extension))
+            if os.path.exists(file_path):
+                continue
+
+            rendition = source.resize((width, round(source.height * width / source.width)), Image.LANCZOS)
+            _save_atomically(file_path, lambda path: rendition.save(
+                path, format='WEBP' if extension == 'webp' else 'JPEG', quality=IMAGE_QUALITY))
+
+
+def _transcode(source_path, file_path, bitrate, seconds=None):
+    def save(path):
+        command = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', source_path, '-vn']
+        if seconds is not None:
+            command += ['-t', str(seconds)]
+        command += ['-codec:a', 'libmp3lame', '-b:a', bitrate, '-f', 'mp3', path]
+        subprocess.run(command, check=True, timeout=TRANSCODE_TIMEOUT)
+
+    _save_atomically(file_path, save)
+
+
+def build_sound_derivatives(upload_folder, name):
+    """Transcodes the sound into a compressed stream rendition and a short preview clip."""
+    if shutil.which('ffmpeg') is None:
+        return
+
+    source_path = os.path.join(upload_folder, name)
+    stream_path = os.path.join(upload_folder, derivative_name(name, 'stream', 'mp3'))
+    if not os.path.exists(stream_path):
+        _transcode(source_path, stream_path, SOUND_BITRATE)
+
+    preview_path = os.path.join(upload_folder, derivative_name(name, 'preview', 'mp3'))
+    if not os.path.exists(preview_path):
+        _transcode(source_path, preview_path, PREVIEW_BITRATE, PREVIEW_SECONDS)
+
+
+def build_derivatives(upload_folder, name, kind):
+    try:
+        if kind == 'image':
+            build_image_derivatives(upload_folder, name)
+        elif kind == 'sound':
+            build_sound_derivatives(upload_folder, name)
+    except Exception:
+        logger.exception('Building the derivatives of %s failed', name)
+
+
+def schedule_derivatives(upload_folder, name):
+    _derivative_pool.submit(build_derivatives, upload_folder, name, media_kind(current_app.config, name))
+
+
+def image_srcset(upload_folder, name):
+    """Returns the srcset of all existing renditions of an image, empty if there are none."""
+    extension = image_extension()
+    if extension is None or not name:
+        return ''
+
+    candidates = []
+    for width in IMAGE_WIDTHS:
+        rendition = derivative_name(name, 'w{}'.format(width), extension)
+        if os.path.exists(os.path.join(upload_folder, rendition)):
+            candidates.append('/uploads/{} {}w'.format(rendition, width))
+    return ', '.join(candidates)
+
+
+def sound_source(upload_folder, name, label='stream'):
+    """Returns the name of the given sound rendition, or the original if it was not built."""
+    if not name:
+        return name
+
+    rendition = derivative_name(name, label, 'mp3')
+    return rendition if os.path.exists(os.path.join(upload_folder, rendition)) else name
+
+
+def remove_derivatives(upload_folder, name):
+    pattern = os.path.join(upload_folder, derivative_name(name, '*', '*'))
+    for file_path in glob.glob(pattern):
+        os.remove(file_path)
+
+
+def get_media_answers():
+    return db_session.query(Answer).join(
+        Question, Answer.question_id == Question.id
+    ).filter(Question.q_type.in_(['image', 'sound'])).all()
+
+
+def get_reference_counts():
+    return dict(db_session.query(Answer.text, func.count(Answer.id)).group_by(Answer.text).all())
+
+
+def collect_garbage(upload_folder):
+    """Removes stored media no answer refers to any more and returns their names."""
+    references = get_reference_counts()
+    now = time.time()
+    removed = []
+    for first in filter(is_shard, os.listdir(upload_folder)):
+        for second in filter(is_shard, os.listdir(os.path.join(upload_folder, first))):
+            directory = os.path.join(upload_folder, first, second)
+            for filename in os.listdir(directory):
+                name = '{}/{}/{}'.format(first, second, filename)
+                file_path = os.path.join(directory, filename)
+                if references.get(name, 0) == 0 and now - os.path.getmtime(file_path) > GC_GRACE_PERIOD:
+                    os.remove(file_path)
+                    remove_derivatives(upload_folder, name)
+                    removed.append(name)
+            if len(os.listdir(directory)) == 0:
+                os.rmdir(directory)
+        if len(os.listdir(os.path.join(upload_folder, first))) == 0:
+            os.rmdir(os.path.join(upload_folder, first))
+    return removed
+
+
+def send_media(upload_folder, filename):
+    """Serves an upload with a strong ETag, immutable caching and byte ranges.
+
+    Upload names are derived from their content and never reused, so the
+    name itself serves as ETag and clients may cache the file forever.
+    """
+    file_path = safe_join(upload_folder, filename)
+    if file_path is None or not os.path.isfile(file_path):
+        abort(404)
+
+    config = current_app.config
+    mimetype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    size = os.path.getsize(file_path)
+
+    if config['MEDIA_ACCEL_REDIRECT'] or current_app.use_x_sendfile:
+        response = current_app.response_class(mimetype=mimetype)
+        if config['MEDIA_ACCEL_REDIRECT']:
+            response.headers['X-Accel-Redirect'] = config['MEDIA_ACCEL_REDIRECT'] + filename
+        else:
+            response.headers['X-Sendfile'] = file_path
+        accept_ranges = False
+    else:
+        response = current_app.response_class(wrap_file(request.environ, open(file_path, 'rb')),
+                                              mimetype=mimetype, direct_passthrough=True)
+        response.content_length = size
+        accept_ranges = True
+
+    response.set_etag(os.path.basename(filename))
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(config['MEDIA_MAX_AGE'])
+    return response.make_conditional(request, accept_ranges=accept_ranges, complete_length=size)
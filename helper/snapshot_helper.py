@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+
+from flask import current_app
+
+from db_handler import db_session
+from helper.generic_helper import build_descriptions
+from models import Participation
+
+
+def snapshot_path(round_id):
+    return os.path.join(current_app.config['SNAPSHOT_FOLDER'], 'round_{}.json'.format(round_id))
+
+
+def build_snapshot(a_round):
+    description_ids = sorted(row.description_id for row in db_session.query(Participation.description_id).filter(
+        Participation.round_id == a_round.id
+    ).all())
+
+    return [{
+        'description_id': description_id,
+        'description': [{
+            'question': {'id': item['question'].id, 'text': item['question'].text, 'q_type': item['question'].q_type},
+            'answer': None if item['answer'] is None else {'text': item['answer'].text}
+        } for item in description]
+    } for description_id, description in zip(description_ids,
+                                              build_descriptions(a_round.questions, description_ids))]
+
+
+def write_snapshot(a_round):
+    """Materialises all descriptions of the round into a JSON file and returns them."""
+    snapshot = build_snapshot(a_round)
+    file_path = snapshot_path(a_round.id)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Unique per writer, two requests building the same snapshot never share a partial file
+    handle, part_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix='.round-', suffix='.part')
+    try:
+        with os.fdopen(handle, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(part_path, file_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return snapshot
+
+
+def read_snapshot(round_id):
+    try:
+        with open(snapshot_path(round_id)) as snapshot_file:
+            return json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+
+
+def invalidate_snapshot(round_id):
+    try:
+        os.remove(snapshot_path(round_id))
+    except FileNotFoundError:
+        pass
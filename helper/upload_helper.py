@@ -0,0 +1,106 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from flask import current_app, Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+def media_kind(config, filename):
+    suffix = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if suffix in config['IMAGE_EXTENSIONS']:
+        return 'image'
+    elif suffix in config['SOUND_EXTENSIONS']:
+        return 'sound'
+    return None
+
+
+def upload_limit(config, filename):
+    kind = media_kind(config, filename)
+    if kind == 'image':
+        return config['MAX_IMAGE_SIZE']
+    elif kind == 'sound':
+        return config['MAX_SOUND_SIZE']
+    return 0
+
+
+class UploadStream(object):
+    """Temporary file in the upload folder the multipart parser writes into.
+
+    The size limit is enforced on every chunk, so an oversized upload is
+    aborted as soon as it crosses the limit. Files which are never stored
+    are removed again when the request is closed.
+    """
+
+    def __init__(self, directory, limit):
+        handle, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.part')
+        self._file = os.fdopen(handle, 'w+b')
+        self.limit = limit
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.started = time.monotonic()
+        self.stored = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            self.close()
+            raise RequestEntityTooLarge()
+        self.digest.update(data)
+        return self._file.write(data)
+
+    def store(self, file_path):
+        """Moves the upload to file_path and returns its throughput in bytes per second."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path, file_path)
+        self.stored = True
+        return self.size / max(time.monotonic() - self.started, 1e-6)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.stored and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class DiscardedUpload(object):
+    """Stream of a file whose type is not accepted, its content is dropped while it is parsed.
+
+    The form handler skips such files, so the rest of the form still gets saved.
+    """
+
+    def write(self, data):
+        return len(data)
+
+    def read(self, size=-1):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return 0
+
+    def close(self):
+        pass
+
+
+class UploadRequest(Request):
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        if media_kind(config, filename) is None:
+            return DiscardedUpload()
+        return UploadStream(config['UPLOAD_FOLDER'], upload_limit(config, filename))
+
+
+def store_upload(u_file, file_path):
+    if isinstance(u_file.stream, UploadStream):
+        throughput = u_file.stream.store(file_path)
+        current_app.logger.info('Stored upload %s, %d bytes at %.1f KiB/s',
+                                file_path, u_file.stream.size, throughput / 1024)
+    else:
+        u_file.save(file_path)
@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from db_handler import db_session, begin_immediate
+from migrations import ADMIN_BOOTSTRAPPED
+from models import User, Setting
+
+
+class CachedUser(object):
+    """Detached stand-in for a User, carrying only what is needed to authorise a request."""
+
+    def __init__(self, email, admin):
+        self.email = email
+        self.admin = admin
+
+    def is_active(self):
+        return True
+
+    def get_id(self):
+        return self.email
+
+    def is_authenticated(self):
+        return True
+
+    def is_admin(self):
+        return self.admin
+
+    def is_anonymous(self):
+        return False
+
+    def __repr__(self):
+        return '<CachedUser {}>'.format(self.email)
+
+
+# email -> (expiry, CachedUser), least recently used first
+_users = OrderedDict()
+_users_lock = Lock()
+# Bumped on every invalidation, so a load racing with it does not cache the old row
+_generation = 0
+
+
+def load_user(email):
+    config = current_app.config
+    now = time.monotonic()
+    with _users_lock:
+        entry = _users.get(email)
+        if entry is not None and entry[0] > now:
+            _users.move_to_end(email)
+            return entry[1]
+        generation = _generation
+
+    row = db_session.query(User.email, User.admin).filter(User.email == email).first()
+    if row is None:
+        return None
+
+    user = CachedUser(row.email, bool(row.admin))
+    with _users_lock:
+        if generation == _generation:
+            _users[email] = (now + config['USER_CACHE_TTL'], user)
+            _users.move_to_end(email)
+        while len(_users) > config['USER_CACHE_SIZE']:
+            _users.popitem(last=False)
+    return user
+
+
+def invalidate_user(email):
+    global _generation
+
+    with _users_lock:
+        _generation += 1
+        _users.pop(email, None)
+
+
+def claim_first_admin():
+    """Marks the admin as bootstrapped and returns whether this call was the one to do so."""
+    try:
+        with db_session.begin_nested():
+            db_session.add(Setting(ADMIN_BOOTSTRAPPED, 1))
+    except IntegrityError:
+        return False
+    return True
+
+
+def create_user(email, password):
+    """Adds a user, the first one becomes admin. Returns None if the email is already taken.
+
+    The transaction takes the SQLite write lock up front, so concurrent
+    signups queue for it and the bootstrap savepoint is a real one.
+    """
+    user = User(email)
+    user.password = password
+    # Hashed before, the lock is only held for the two inserts
+    begin_immediate(db_session)
+    db_session.add(user)
+    try:
+        db_session.flush()
+    except IntegrityError:
+        db_session.rollback()
+        return None
+
+    user.admin = claim_first_admin()
+    db_session.commit()
+    return user
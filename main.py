@@ -1,51 +1,92 @@
 from functools import wraps
-from random import shuffle
 
-from flask import Flask, render_template, redirect, url_for, flash, send_from_directory, request
+import click
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, session, current_app
+from flask.cli import with_appcontext
 from flask_babel import Babel, gettext
 from flask_login import LoginManager, login_required, \
     login_user, logout_user, current_user
 
-from flask_mail import Mail
-
-from itsdangerous import URLSafeTimedSerializer
-
-import helper.generic_helper as generic_helper, helper.mail_helper as mail_helper
+import helper.generic_helper as generic_helper, helper.mail_helper as mail_helper, \
+    helper.media_helper as media_helper, helper.gallery_helper as gallery_helper, \
+    helper.user_helper as user_helper
 from admin import handle_admin, handle_edit_user, handle_edit_question, \
 handle_edit_round, handle_edit_participation
-from db_handler import db_session, init_db
+from db_handler import db_session, init_engine, init_db, begin_immediate
+from helper.upload_helper import UploadRequest, media_kind
 from description import handle_description_form
 from forms import LoginForm, SignUpForm, QuestionForm, \
 RequestResetPasswordForm, ResetPasswordForm
-from models import User, Question
+from models import User, Question, Round
+from password import PasswordHashBusy, configure_hashing_pool, hashing_metrics
+
+# Extensions are bound to the app in create_app
+login_manager = LoginManager()
+babel = Babel()
 
-# Initialize the base app and load the config
-app = Flask(__name__, instance_relative_config=True)
-app.config.from_envvar('FLASK_CONFIG')
+# Views collected by @route and registered by create_app
+routes = []
 
-# Initialize the mail
-mail = Mail()
-mail.init_app(app)
 
-# Initialize 
-ts = URLSafeTimedSerializer(app.config["SECRET_KEY"])
+def route(rule, **options):
+    def decorator(view_func):
+        routes.append((rule, view_func, options))
+        return view_func
 
-# Initialize the login manager
-login_manager = LoginManager()
-login_manager.init_app(app)
+    return decorator
+
+
+def create_app(config=None):
+    # Initialize the base app and load the config
+    app = Flask(__name__, instance_relative_config=True)
+    app.config.from_envvar('FLASK_CONFIG')
+    if config is not None:
+        app.config.update(config)
+    app.request_class = UploadRequest
+    init_engine(app.config)
+    init_db()
+
+    for rule, view_func, options in routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+    app.teardown_appcontext(close_db)
+    app.register_error_handler(PasswordHashBusy, password_hash_busy)
+    app.add_template_global(image_srcset)
+    app.add_template_global(sound_source)
+    app.cli.add_command(collect_media)
+    app.cli.add_command(build_derivatives)
+    app.cli.add_command(create_admin)
+
+    # Initialize the login manager and Babel for I18n
+    login_manager.init_app(app)
+    babel.init_app(app)
+
+    # Initialize the password hashing pool
+    configure_hashing_pool(app.config['PASSWORD_HASH_WORKERS'], app.config['PASSWORD_HASH_QUEUE_DEPTH'])
+
+    # Initialize the mail, it is only sent from the background worker
+    from flask_mail import Mail
+    mail = Mail(app)
+    app.extensions['mail_worker'] = mail_helper.start_mail_worker(app, mail)
+    return app
 
-# Initialize Babel for I18n
-babel = Babel(app)
+
+def reset_serializer():
+    from itsdangerous import URLSafeTimedSerializer
+
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
 
 
-@app.teardown_appcontext
 def close_db(exception=None):
     db_session.remove()
 
 
+def password_hash_busy(error):
+    return gettext(u"The server is busy right now. Please try again in a moment."), 503, {'Retry-After': '1'}
+
+
 @login_manager.user_loader
 def user_loader(identifier):
-    return User.query.get(identifier)
+    return user_helper.load_user(identifier)
 
 
 @login_manager.unauthorized_handler
@@ -63,20 +104,22 @@ def admin_required(func):
     return decorated_view
 
 
-@app.route("/logout")
+@route("/logout")
 def logout():
     logout_user()
     return redirect(url_for('login'))
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.get(form.email.data)
         if user is not None:
-            user.validated = user.password == form.password.data
+            user.validated = user.check_password(form.password.data)
             if user.validated:
+                # Persists a rehash done for an outdated cost factor
+                db_session.commit()
                 login_user(user)
                 return redirect(url_for('index'))
 
@@ -87,7 +130,7 @@ def login():
     return render_template("login.html", form=form, active=-1)
 
 
-@app.route('/request_reset_password', methods=['GET', 'POST'])
+@route('/request_reset_password', methods=['GET', 'POST'])
 def request_reset_password():
 # Now we'll send the email confirmation link
     form = RequestResetPasswordForm()
@@ -96,8 +139,8 @@ def request_reset_password():
         if user is not None:
             email_address = user.email
      
-            token = ts.dumps(email_address, salt='reset-password-key')
-            mail_helper.send_reset_mail(mail, user.email, token)
+            token = reset_serializer().dumps(email_address, salt='reset-password-key')
+            mail_helper.send_reset_mail(user.email, token)
             flash(gettext(u"E-Mail has been sent. Please check your \
                     inbox."))
             
@@ -110,12 +153,12 @@ def request_reset_password():
     return render_template("request_reset_password.html", form=form, active=-1)
 
 
-@app.route('/reset_password/<token>', methods=['GET', 'POST'])
+@route('/reset_password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
     form = ResetPasswordForm()
     
     try:
-        email = ts.loads(token, salt="reset-password-key", max_age=1800)
+        email = reset_serializer().loads(token, salt="reset-password-key", max_age=1800)
     except:
         flash(gettext(u"Invalid token. Maybe it is outdated."))
         return redirect(url_for('index'))
@@ -126,6 +169,7 @@ def reset_password(token):
         
         db_session.add(user)
         db_session.commit()
+        user_helper.invalidate_user(user.email)
         
         flash(gettext(u"Password changed successfully."))
         return redirect(url_for('index'))
@@ -135,7 +179,7 @@ def reset_password(token):
     
     return render_template("reset_pw.html", token=token, form=form, active=-1)
 
-@app.route("/", methods=['GET', 'POST'])
+@route("/", methods=['GET', 'POST'])
 @login_required
 def index():
     cur_round = generic_helper.get_cur_round()
@@ -152,10 +196,10 @@ def index():
             elif participation.other_description:
                 desc = generic_helper.build_description(cur_round.questions, participation.other_description.id)
             else:
-                form = generic_helper.build_description_form(cur_round, generic_helper.get_cur_participation(cur_round.id).description)
+                form = generic_helper.build_description_form(cur_round, participation.description)
         else:
             participations = generic_helper.get_cur_participations(cur_round.id)
-            can_participate = all([not l_participation.other_description for l_participation in participations])
+            can_participate = all([not l_participation.other_description_id for l_participation in participations])
     return render_template('index.html', active=0, is_admin=current_user.is_admin(),
                            active_round=cur_round is not None,
                            participation=participation,
@@ -163,14 +207,14 @@ def index():
                            description=desc, form=form)
 
 
-@app.route("/edit_participation")
+@route("/edit_participation")
 @login_required
 def edit_participation():
     action = request.args.get('action')
     return handle_edit_participation(action)
 
 
-@app.route("/add_question", methods=['GET', 'POST'])
+@route("/add_question", methods=['GET', 'POST'])
 @login_required
 def add_question():
     cur_round = generic_helper.get_cur_round()
@@ -187,46 +231,106 @@ def add_question():
     return redirect(url_for('index'))
 
 
-@app.route("/admin")
+@route("/admin")
 @admin_required
 @login_required
 def admin():
     return handle_admin()
 
 
-@app.route("/edit_round/<action>")
+@route("/admin/password_metrics")
+@admin_required
+@login_required
+def password_metrics():
+    # Each gunicorn worker has its own pool, this only reports the one serving the request
+    return jsonify(hashing_metrics())
+
+
+@route("/edit_round/<action>")
 @admin_required
 @login_required
 def edit_round(action):
     return handle_edit_round(action)
 
 
-@app.route("/edit_user")
+@route("/edit_user")
 @admin_required
 @login_required
 def edit_user():
     return handle_edit_user()
 
 
-@app.route("/edit_question")
+@route("/edit_question")
 @admin_required
 @login_required
 def edit_question():
     return handle_edit_question()
 
 
-@app.route("/description", methods=['GET', 'POST'])
+@route("/description", methods=['GET', 'POST'])
 @login_required
 def description():
-    return handle_description_form(app.config)
+    return handle_description_form(current_app.config)
 
 
-@app.route('/uploads/<filename>')
+@route('/uploads/<path:filename>')
 def send_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return media_helper.send_media(current_app.config['UPLOAD_FOLDER'], filename)
+
+
+@click.command('collect-media')
+@with_appcontext
+def collect_media():
+    """Removes uploaded files which are no longer referenced by any answer."""
+    for name in media_helper.collect_garbage(current_app.config['UPLOAD_FOLDER']):
+        print('Removed {}'.format(name))
+
+
+@click.command('build-derivatives')
+@with_appcontext
+def build_derivatives():
+    """Renders the missing image renditions and sound transcodings of all uploads."""
+    for answer in media_helper.get_media_answers():
+        media_helper.build_derivatives(current_app.config['UPLOAD_FOLDER'], answer.text,
+                                       media_kind(current_app.config, answer.text))
+
+
+@click.command('create-admin')
+@click.argument('email')
+@click.password_option()
+@with_appcontext
+def create_admin(email, password):
+    """Creates an admin or promotes an existing user, signups no longer become admin afterwards."""
+    begin_immediate(db_session)
+    user = User.query.get(email)
+    if user is None:
+        user = User(email)
+        db_session.add(user)
+    user.password = password
+    user.admin = True
+    user_helper.claim_first_admin()
+    db_session.commit()
+    user_helper.invalidate_user(email)
+    print('{} is an admin now'.format(email))
+
+
+def image_srcset(name):
+    return media_helper.image_srcset(current_app.config['UPLOAD_FOLDER'], name)
 
 
-@app.route("/gallery")
+def sound_source(name, label='stream'):
+    return media_helper.sound_source(current_app.config['UPLOAD_FOLDER'], name, label)
+
+
+def render_gallery(a_round):
+    descriptions, pages = gallery_helper.get_gallery_page(a_round, gallery_helper.get_gallery_seed(session), 0,
+                                                          current_app.config['GALLERY_PAGE_SIZE'])
+
+    return render_template('gallery.html', active=2, is_admin=True,
+                           descriptions=descriptions, pages=pages, round_id=a_round.id)
+
+
+@route("/gallery")
 @admin_required
 @login_required
 def gallery():
@@ -234,30 +338,43 @@ def gallery():
 
     if cur_round is None:
         return redirect(url_for('admin'))
-    else:
-        descriptions = [
-            generic_helper.build_description(cur_round.questions, participation.description_id)
-            for participation in generic_helper.get_cur_participations(cur_round.id)
-        ]
-        shuffle(descriptions)
+    return render_gallery(cur_round)
 
-    return render_template('gallery.html', active=2, is_admin=True,
-                           descriptions=descriptions)
 
+@route("/gallery/<int:round_id>")
+@admin_required
+@login_required
+def round_gallery(round_id):
+    a_round = db_session.query(Round).get(round_id)
+
+    if a_round is None:
+        return redirect(url_for('admin'))
+    return render_gallery(a_round)
 
-@app.route("/signup", methods=['GET', 'POST'])
+
+@route("/gallery/<int:round_id>/page/<int:page>")
+@admin_required
+@login_required
+def gallery_page(round_id, page):
+    a_round = db_session.query(Round).get(round_id)
+
+    if a_round is None:
+        return jsonify(page=page, pages=0, slides=[]), 404
+
+    descriptions, pages = gallery_helper.get_gallery_page(a_round, gallery_helper.get_gallery_seed(session), page,
+                                                          current_app.config['GALLERY_PAGE_SIZE'])
+    return jsonify(page=page, pages=pages,
+                   slides=[render_template('description.html', description=description)
+                           for description in descriptions])
+
+
+@route("/signup", methods=['GET', 'POST'])
 def signup():
     form = SignUpForm()
     if form.validate_on_submit(): 
-        user = User.query.get(form.email.data)
-        if user is None:
-            user = User()
-            user.email = form.email.data
-            user.password = form.password.data
-            user.admin = db_session.query(User).count() < 1
+        user = user_helper.create_user(form.email.data, form.password.data)
+        if user is not None:
             user.authenticated = True
-            db_session.add(user)
-            db_session.commit()
             login_user(user)
         else:
             flash(gettext(u"A user with this email already exists."))
@@ -269,7 +386,7 @@ def signup():
 
 
 if __name__ == "__main__":
-    init_db()
+    app = create_app()
 
     app.debug = True
     app.run(host='0.0.0.0')
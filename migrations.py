@@ -0,0 +1,96 @@
+from sqlalchemy import inspect, text
+
+import models
+from db_handler import Base, SQLITE_BEGIN
+
+SCHEMA_VERSION = 'schema_version'
+# Present once the first admin exists, whoever inserts it becomes that admin
+ADMIN_BOOTSTRAPPED = 'admin_bootstrapped'
+# Arbitrary key of the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK = 7305216
+
+
+def create_tables(connection):
+    Base.metadata.create_all(bind=connection)
+
+
+def add_lookup_indexes(connection):
+    # Tables created before the indexes were declared on the models lack them
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if table is models.Answer.__table__ and index.unique:
+                # Older databases may hold several answers per question, keep the newest one
+                connection.execute(text(
+                    'DELETE FROM answers WHERE id NOT IN '
+                    '(SELECT MAX(id) FROM answers GROUP BY description_id, question_id)'
+                ))
+            index.create(bind=connection)
+
+
+def mark_admin_bootstrapped(connection):
+    # Up to now the first user to sign up became admin
+    connection.execute(text(
+        'INSERT INTO settings (key, value) SELECT :key, 1 WHERE EXISTS (SELECT 1 FROM users)'
+    ), key=ADMIN_BOOTSTRAPPED)
+
+
+# Append new migrations at the end, their number is the resulting schema version.
+# They only run on databases that predate them, fresh ones are created from the models.
+MIGRATIONS = [
+    (1, create_tables),
+    (2, add_lookup_indexes),
+    (3, mark_admin_bootstrapped),
+]
+
+
+def get_schema_version(connection):
+    # Probing instead of catching the error, a failed statement aborts a PostgreSQL transaction
+    if not connection.dialect.has_table(connection, models.Setting.__tablename__):
+        return 0
+    version = connection.execute(
+        text('SELECT value FROM settings WHERE key = :key'), key=SCHEMA_VERSION
+    ).scalar()
+    return version or 0
+
+
+def set_schema_version(connection, version):
+    updated = connection.execute(
+        text('UPDATE settings SET value = :value WHERE key = :key'), key=SCHEMA_VERSION, value=version
+    ).rowcount
+    if updated == 0:
+        connection.execute(
+            text('INSERT INTO settings (key, value) VALUES (:key, :value)'), key=SCHEMA_VERSION, value=version
+        )
+
+
+def lock_schema(connection):
+    # Concurrent runners queue here and then read the version the first one committed.
+    # SQLite is already locked by the BEGIN IMMEDIATE of the migration transaction.
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), key=MIGRATION_LOCK)
+
+
+def migrate(engine):
+    """Runs all pending migrations in one transaction and returns the schema version."""
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+    if version >= MIGRATIONS[-1][0]:
+        return version
+
+    with engine.execution_options(**{SQLITE_BEGIN: 'IMMEDIATE'}).begin() as connection:
+        lock_schema(connection)
+        # Another process may have migrated in the meantime
+        version = get_schema_version(connection)
+        if version == 0 and not connection.dialect.has_table(connection, models.User.__tablename__):
+            create_tables(connection)
+            version = MIGRATIONS[-1][0]
+        for target, migration in MIGRATIONS:
+            if target > version:
+                migration(connection)
+                version = target
+        set_schema_version(connection, version)
+    return version
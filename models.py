@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Date, Table, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Date, DateTime, Table, Enum, Index, Text
 from sqlalchemy.orm import validates, relationship
 
 from db_handler import Base
@@ -21,6 +21,15 @@ class User(Base):
         self.validated = getattr(type(self), key).type.validator(password)
         return self.validated
 
+    def check_password(self, password):
+        """Verifies the password and rehashes it if the stored cost factor is outdated."""
+        if self.password is None or not self.password.verify(password):
+            return False
+
+        if self.password.needs_rehash(type(self).password.type.rounds):
+            self.password = password
+        return True
+
     def is_active(self):
         return True
 
@@ -47,15 +56,15 @@ class User(Base):
 
 round_questions = Table(
     'associations', Base.metadata,
-    Column('round_id', Integer, ForeignKey('rounds.id')),
-    Column('question_id', Integer, ForeignKey('questions.id'))
+    Column('round_id', Integer, ForeignKey('rounds.id'), index=True),
+    Column('question_id', Integer, ForeignKey('questions.id'), index=True)
 )
 
 
 class Round(Base):
     __tablename__ = 'rounds'
     id = Column(Integer, primary_key=True)
-    running = Column(Boolean)
+    running = Column(Boolean, index=True)
     created_at = Column(Date)
     questions = relationship("Question", secondary=round_questions)
 
@@ -71,7 +80,7 @@ class Round(Base):
 class Participation(Base):
     __tablename__ = 'participations'
     id = Column(Integer, primary_key=True)
-    round_id = Column(Integer, ForeignKey('rounds.id'))
+    round_id = Column(Integer, ForeignKey('rounds.id'), index=True)
     cur_round = relationship("Round", foreign_keys=[round_id])
     description_id = Column(Integer, ForeignKey('descriptions.id'))
     description = relationship("Description", foreign_keys=[description_id])
@@ -92,14 +101,17 @@ class Participation(Base):
 class Description(Base):
     __tablename__ = 'descriptions'
     id = Column('id', Integer, primary_key=True)
-    user_id = Column(String(120), ForeignKey('users.email'))
+    user_id = Column(String(120), ForeignKey('users.email'), index=True)
     user = relationship("User", foreign_keys=[user_id])
     answers = []
 
-    def __init__(self, user=None, questions=None):
+    def __init__(self, user=None, questions=None, user_id=None):
         if questions is None:
             questions = []
-        self.user = user
+        if user is not None:
+            self.user = user
+        else:
+            self.user_id = user_id
         self.questions = questions
 
 
@@ -107,7 +119,7 @@ class Question(Base):
     __tablename__ = 'questions'
     id = Column('id', Integer, primary_key=True)
     text = Column(String(512))
-    q_type = Column('type', Enum('text', 'image', 'sound'))
+    q_type = Column('type', Enum('text', 'image', 'sound', name='question_type'))
 
     def __init__(self, text=None, q_type='text'):
         self.text = text
@@ -116,6 +128,9 @@ class Question(Base):
 
 class Answer(Base):
     __tablename__ = 'answers'
+    __table_args__ = (
+        Index('ix_answers_description_question', 'description_id', 'question_id', unique=True),
+    )
     id = Column('id', Integer, primary_key=True)
     description_id = Column(Integer, ForeignKey('descriptions.id'))
     description = relationship("Description", foreign_keys=[description_id])
@@ -127,3 +142,40 @@ class Answer(Base):
         self.description = description
         self.question = question
         self.text = text
+
+
+class Setting(Base):
+    __tablename__ = 'settings'
+    key = Column(String(64), primary_key=True)
+    value = Column(Integer)
+
+    def __init__(self, key=None, value=0):
+        self.key = key
+        self.value = value
+
+
+class QueuedMail(Base):
+    __tablename__ = 'mail_queue'
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String(120))
+    round_id = Column(Integer, ForeignKey('rounds.id'), index=True)
+    subject = Column(String(256))
+    html = Column(Text)
+    status = Column(String(16), index=True)
+    attempts = Column(Integer)
+    next_attempt_at = Column(DateTime)
+    claimed_by = Column(String(36))
+    sent_at = Column(DateTime)
+    last_error = Column(String(512))
+
+    def __init__(self, recipient=None, subject=None, html=None, round_id=None):
+        self.recipient = recipient
+        self.round_id = round_id
+        self.subject = subject
+        self.html = html
+        self.status = 'queued'
+        self.attempts = 0
+        self.next_attempt_at = datetime.utcnow()
+
+    def __repr__(self):
+        return "<QueuedMail {}: To: {} Status: {}>".format(self.id, self.recipient, self.status)
@@ -1,5 +1,77 @@
+import os
+import time
+from threading import BoundedSemaphore, Lock
+
 from sqlalchemy import Text, TypeDecorator
-import bcrypt
+
+
+class PasswordHashBusy(Exception):
+    """Raised when too many hashing jobs are already running or waiting."""
+
+
+class HashingPool(object):
+    """Limits how many bcrypt jobs the request threads of a process run at once.
+
+    Jobs run in the calling thread, bcrypt releases the GIL while hashing.
+    At most workers jobs run at the same time and up to queue_depth more
+    wait for a slot, further jobs are rejected with PasswordHashBusy so
+    some request threads stay free for other pages.
+    """
+
+    def __init__(self, workers=2, queue_depth=1):
+        self._running = BoundedSemaphore(workers)
+        self._admitted = BoundedSemaphore(workers + queue_depth)
+        self._lock = Lock()
+        self._started = time.monotonic()
+        self._completed = 0
+        self._rejected = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def run(self, func, *args):
+        """Runs func(*args) once a slot is free and returns its result."""
+        if not self._admitted.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHashBusy()
+
+        start = time.monotonic()
+        try:
+            with self._running:
+                return func(*args)
+        finally:
+            self._admitted.release()
+            latency = time.monotonic() - start
+            with self._lock:
+                self._completed += 1
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
+
+    def metrics(self):
+        """Returns latency and throughput figures since the pool was created."""
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            return {
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'avg_latency': self._total_latency / self._completed if self._completed else 0.0,
+                'max_latency': self._max_latency,
+                'throughput': self._completed / elapsed if elapsed > 0 else 0.0,
+            }
+
+
+hashing_pool = HashingPool()
+
+
+def configure_hashing_pool(workers, queue_depth):
+    """Replaces the module wide hashing pool with one of the given size."""
+    global hashing_pool
+    hashing_pool = HashingPool(workers, queue_depth)
+
+
+def hashing_metrics():
+    """Returns the metrics of the module wide hashing pool, which only cover this process."""
+    return dict(hashing_pool.metrics(), pid=os.getpid())
 
 
 class Password(TypeDecorator):
@@ -11,8 +83,10 @@ class Password(TypeDecorator):
         super(Password, self).__init__(**kwds)
 
     def process_bind_param(self, value, dialect):
-        """Ensure the value is a PasswordHash and then return its hash."""
-        return self._convert(value).hash
+        """Ensure the value is a PasswordHash and then return its hash as text."""
+        password_hash = self._convert(value)
+        if password_hash is not None:
+            return password_hash.hash.decode('utf8')
 
     def process_result_value(self, value, dialect):
         """Convert the hash to a PasswordHash, if it's non-NULL."""
@@ -49,13 +123,21 @@ class PasswordHash(object):
         self.rounds = int(self.hash.split(b'$')[2])
 
     def __eq__(self, candidate):
-        """Hashes the candidate string and compares it to the stored hash."""
-        if isinstance(candidate,str):
-                candidate = candidate.encode('utf8')
-                cmp_hash = bcrypt.hashpw(candidate, self.hash)
-                return cmp_hash == self.hash
+        """Checks the candidate string against the stored hash."""
+        return self.verify(candidate)
+
+    def verify(self, candidate):
+        """Checks the candidate string against the stored hash with one bcrypt run."""
+        import bcrypt
+
+        if isinstance(candidate, str):
+            return hashing_pool.run(bcrypt.checkpw, candidate.encode('utf8'), self.hash)
         return False
 
+    def needs_rehash(self, rounds):
+        """Tells whether the hash was made with fewer rounds than requested."""
+        return self.rounds < rounds
+
     def __repr__(self):
         """Simple object representation."""
         return '<{}>'.format(type(self).__name__)
@@ -63,4 +145,6 @@ class PasswordHash(object):
     @classmethod
     def new(cls, password, rounds):
         """Creates a PasswordHash from the given password."""
-        return cls(bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt(rounds)))
+        import bcrypt
+
+        return cls(hashing_pool.run(bcrypt.hashpw, password.encode('utf8'), bcrypt.gensalt(rounds)))
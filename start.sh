@@ -8,4 +8,4 @@ git pull
 export FLASK_CONFIG="/home/nemonessuno/Dropbox/Projekte/SecretSanta/config.py"
 export FLASK_APP=main.py
 
-pipenv run gunicorn -w 4 -b 0.0.0.0:5000 main:app
+pipenv run gunicorn -w 4 --threads 4 -b 0.0.0.0:5000 'main:create_app()'
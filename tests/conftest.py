@@ -0,0 +1,132 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['FLASK_CONFIG'] = os.path.join(ROOT, 'config.py')
+# Stand-ins for secret_config, which is not part of the repository
+for key, value in [('SECRET_KEY', 'test'), ('MAIL_SERVER', 'localhost'), ('MAIL_PORT', '25'),
+                   ('MAIL_USE_TLS', 'false'), ('MAIL_USE_SSL', 'false'), ('MAIL_USERNAME', 'santa'),
+                   ('MAIL_PASSWORD', 'secret')]:
+    os.environ.setdefault(key, value)
+
+import db_handler  # noqa: E402
+import helper.generic_helper as generic_helper  # noqa: E402
+import helper.user_helper as user_helper  # noqa: E402
+from main import create_app  # noqa: E402
+from models import User  # noqa: E402
+
+# e.g. postgresql://santa@localhost/santa_test, its tables are dropped by every test
+POSTGRESQL_URL = os.environ.get('TEST_POSTGRESQL_URL')
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database_url(request, tmp_path):
+    if request.param == 'sqlite':
+        return 'sqlite:///{}'.format(tmp_path / 'database.db')
+
+    if POSTGRESQL_URL is None:
+        pytest.skip('TEST_POSTGRESQL_URL is not set')
+    engine = create_engine(POSTGRESQL_URL)
+    with engine.begin() as connection:
+        connection.execute(text('DROP SCHEMA public CASCADE'))
+        connection.execute(text('CREATE SCHEMA public'))
+    engine.dispose()
+    return POSTGRESQL_URL
+
+
+@pytest.fixture
+def app_config():
+    """Settings on top of the test defaults, overridden by the modules which need others."""
+    return {}
+
+
+@pytest.fixture
+def app(database_url, app_config, tmp_path):
+    # Process wide caches would otherwise hand out rows of the previous test's database
+    generic_helper._cur_round_cache = (None, None)
+    generic_helper.description_form_class.cache_clear()
+    user_helper._users.clear()
+
+    upload_folder = tmp_path / 'uploads'
+    upload_folder.mkdir()
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'MAIL_SUPPRESS_SEND': True,
+        'DATABASE_URL': database_url,
+        'UPLOAD_FOLDER': str(upload_folder),
+        'SNAPSHOT_FOLDER': str(tmp_path / 'snapshots'),
+        **app_config
+    })
+    yield app
+
+    worker = app.extensions['mail_worker']
+    worker.stop()
+    worker.join()
+    db_handler.db_session.remove()
+    db_handler.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def signup(client, email, password='secret'):
+    return client.post('/signup', data={'email': email, 'password': password, 'confirm': password})
+
+
+def add_users(emails):
+    # Without passwords, so no time is spent hashing, log them in with login_as
+    for email in emails:
+        db_handler.db_session.add(User(email))
+    db_handler.db_session.commit()
+
+
+def login_as(client, email):
+    with client.session_transaction() as session:
+        # Flask-Login renamed the key in 0.5
+        session['user_id'] = session['_user_id'] = email
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def admin_client(client):
+    signup(client, 'admin@example.org')
+    return client
+
+
+@pytest.fixture
+def count_queries(app):
+    """Returns a context manager collecting the statements and commits of this thread."""
+
+    @contextmanager
+    def counter():
+        thread = threading.get_ident()
+        counts = {'statements': [], 'commits': 0}
+
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == thread:
+                counts['statements'].append(statement)
+
+        def commit(connection):
+            if threading.get_ident() == thread:
+                counts['commits'] += 1
+
+        event.listen(db_handler.engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(db_handler.engine, 'commit', commit)
+        try:
+            yield counts
+        finally:
+            event.remove(db_handler.engine, 'before_cursor_execute', before_cursor_execute)
+            event.remove(db_handler.engine, 'commit', commit)
+
+    return counter
@@ -0,0 +1,128 @@
+import db_handler
+import helper.mail_helper as mail_helper
+import migrations
+from conftest import signup
+from db_handler import db_session, Base
+from models import User, Round, Participation, Answer, Setting, Question, QueuedMail
+
+
+def start_round(client, questions=('Favourite colour?',), q_type='text'):
+    """Starts a round with new questions, joins it and returns the ids of the questions."""
+    client.get('/edit_round/add')
+    client.get('/edit_participation?action=add')
+    for text in questions:
+        client.post('/add_question', data={'text': text, 'q_type': q_type})
+    question_ids = [question_id for question_id, in db_session.query(Question.id).order_by(Question.id.desc()).limit(
+        len(questions))][::-1]
+    db_session.remove()
+    for question_id in question_ids:
+        client.get('/edit_question?action=use&id={}'.format(question_id))
+    return question_ids
+
+
+def test_migrate(app):
+    latest = migrations.MIGRATIONS[-1][0]
+    with db_handler.engine.connect() as connection:
+        assert migrations.get_schema_version(connection) == latest
+
+    assert migrations.migrate(db_handler.engine) == latest
+    assert db_session.query(Setting).get(migrations.ADMIN_BOOTSTRAPPED) is None
+
+
+def test_fresh_database_skips_migrations(app, monkeypatch):
+    def add_column(connection):
+        raise AssertionError('a fresh database already has the latest tables')
+
+    Base.metadata.drop_all(bind=db_handler.engine)
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(99, add_column)])
+
+    assert migrations.migrate(db_handler.engine) == 99
+    assert db_session.query(User).count() == 0
+
+
+def test_migrate_unversioned_database(app):
+    db_session.add(User('old@example.org', admin=True))
+    db_session.commit()
+    db_session.remove()
+    Setting.__table__.drop(bind=db_handler.engine)
+
+    assert migrations.migrate(db_handler.engine) == migrations.MIGRATIONS[-1][0]
+    assert db_session.query(Setting).get(migrations.ADMIN_BOOTSTRAPPED) is not None
+
+
+def test_migrate_existing_users(app):
+    db_session.add(User('old@example.org', admin=True))
+    db_session.query(Setting).filter(Setting.key == migrations.ADMIN_BOOTSTRAPPED).delete()
+    db_session.commit()
+    with db_handler.engine.begin() as connection:
+        migrations.set_schema_version(connection, 2)
+
+    assert migrations.migrate(db_handler.engine) == migrations.MIGRATIONS[-1][0]
+    assert db_session.query(Setting).get(migrations.ADMIN_BOOTSTRAPPED) is not None
+
+
+def test_signup_and_login(client, app):
+    assert signup(client, 'first@example.org').status_code == 302
+    assert signup(app.test_client(), 'second@example.org').status_code == 302
+    assert signup(app.test_client(), 'second@example.org').status_code == 302
+
+    users = {user.email: user.admin for user in db_session.query(User)}
+    assert users == {'first@example.org': True, 'second@example.org': False}
+
+    other = app.test_client()
+    response = other.post('/login', data={'email': 'second@example.org', 'password': 'wrong'})
+    assert response.status_code == 200
+    response = other.post('/login', data={'email': 'second@example.org', 'password': 'secret'})
+    assert response.status_code == 302
+    assert other.get('/').status_code == 200
+
+
+def test_round_add_shuffle_stop(admin_client, app):
+    start_round(admin_client)
+    for index in range(3):
+        client = app.test_client()
+        signup(client, 'user{}@example.org'.format(index))
+        client.get('/edit_participation?action=add')
+
+    assert admin_client.get('/edit_round/shuffle').status_code == 302
+    participations = db_session.query(Participation).all()
+    assert len(participations) == 4
+    assert all(p.other_description_id not in (None, p.description_id) for p in participations)
+    assert len({p.other_description_id for p in participations}) == 4
+
+    assignments = {p.id: p.other_description_id for p in participations}
+    db_session.remove()
+    assert admin_client.get('/edit_round/shuffle').status_code == 302
+    assert {p.id: p.other_description_id for p in db_session.query(Participation)} == assignments
+    assert db_session.query(QueuedMail).count() == 4
+
+    assert admin_client.get('/edit_round/stop').status_code == 302
+    db_session.remove()
+    assert db_session.query(Round).filter(Round.running).count() == 0
+    assert admin_client.get('/gallery/1').status_code == 200
+
+
+def test_delivery_status_of_a_repeated_mail(admin_client):
+    start_round(admin_client)
+    round_id = db_session.query(Round.id).scalar()
+    first = QueuedMail('user@example.org', 'Drawn', '', round_id)
+    second = QueuedMail('user@example.org', 'Drawn', '', round_id)
+    second.status = 'sent'
+    db_session.add_all([first, second])
+    db_session.commit()
+    # Moves the older row behind the newer one on PostgreSQL
+    first.status = 'failed'
+    db_session.commit()
+
+    assert mail_helper.get_delivery_status(round_id) == {'user@example.org': 'sent'}
+
+
+def test_description_save(admin_client):
+    start_round(admin_client, ['Colour?', 'Animal?'])
+
+    assert admin_client.post('/description', data={'question_1': 'blue', 'question_2': 'owl'}).status_code == 302
+    assert admin_client.post('/description', data={'question_1': 'green', 'question_2': ''}).status_code == 302
+
+    answers = {answer.question_id: answer.text for answer in db_session.query(Answer)}
+    assert answers == {1: 'green', 2: 'owl'}
+    assert b'green' in admin_client.get('/').data
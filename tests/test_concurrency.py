@@ -0,0 +1,72 @@
+import threading
+from collections import Counter
+
+from conftest import add_users, login_as
+from db_handler import db_session
+from models import Answer
+from test_backends import start_round
+
+WRITERS = 16
+SAVES = 10
+DOUBLE_SUBMITS = 40
+
+
+def test_concurrent_description_saves(admin_client, app):
+    start_round(admin_client, ['Colour?', 'Animal?', 'Food?'])
+    emails = ['writer{}@example.org'.format(index) for index in range(WRITERS)]
+    add_users(emails)
+    clients = []
+    for email in emails:
+        client = login_as(app.test_client(), email)
+        client.get('/edit_participation?action=add')
+        clients.append(client)
+
+    statuses = Counter()
+    barrier = threading.Barrier(WRITERS)
+
+    def save(index, client):
+        barrier.wait()
+        for save_index in range(SAVES):
+            try:
+                response = client.post('/description', data={
+                    'question_{}'.format(question_id): '{}-{}'.format(index, save_index) for question_id in (1, 2, 3)
+                })
+                statuses[response.status_code] += 1
+            except Exception as error:
+                # The app runs in testing mode, so errors reach the client instead of becoming a 500
+                statuses[repr(error)[:80]] += 1
+
+    threads = [threading.Thread(target=save, args=(index, client)) for index, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == {302: WRITERS * SAVES}
+    answers = db_session.query(Answer).all()
+    assert len(answers) == WRITERS * 3
+    assert {answer.text for answer in answers} == {'{}-{}'.format(index, SAVES - 1) for index in range(WRITERS)}
+
+
+def test_racing_submits_of_one_description(admin_client, app):
+    question_ids = start_round(admin_client, ['Colour?', 'Animal?', 'Food?'])
+    data = {'question_{}'.format(question_id): 'answer' for question_id in question_ids}
+    statuses = Counter()
+    barrier = threading.Barrier(DOUBLE_SUBMITS)
+
+    def submit(client):
+        barrier.wait()
+        try:
+            statuses[client.post('/description', data=data).status_code] += 1
+        except Exception as error:
+            statuses[repr(error)[:80]] += 1
+
+    clients = [login_as(app.test_client(), 'admin@example.org') for index in range(DOUBLE_SUBMITS)]
+    threads = [threading.Thread(target=submit, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == {302: DOUBLE_SUBMITS}
+    assert db_session.query(Answer).count() == len(question_ids)
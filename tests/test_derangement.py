@@ -0,0 +1,69 @@
+import itertools
+import random
+import time
+from collections import Counter
+
+import pytest
+
+from helper.derangement import random_derangement, constrained_derangement, _matching
+
+SAMPLES = 18000
+# Chi-square critical value for 8 degrees of freedom at p = 0.001
+CHI_SQUARE_LIMIT = 26.12
+LARGE_N = 10 ** 6
+# Seconds for LARGE_N, a run took about 1.8
+LARGE_N_BUDGET = 10
+
+
+def is_derangement(values, n):
+    return sorted(values) == list(range(n)) and all(i != j for i, j in enumerate(values))
+
+
+def test_derangements_of_four_are_uniform():
+    rng = random.Random(4)
+    derangements = [p for p in itertools.permutations(range(4)) if is_derangement(p, 4)]
+    assert len(derangements) == 9
+
+    counts = Counter(random_derangement(4, rng) for _ in range(SAMPLES))
+    assert set(counts) == set(derangements)
+    expected = SAMPLES / len(derangements)
+    chi_square = sum((counts[p] - expected) ** 2 / expected for p in derangements)
+    assert chi_square < CHI_SQUARE_LIMIT
+
+
+def test_large_derangement():
+    started = time.perf_counter()
+    values = random_derangement(LARGE_N, random.Random(1))
+    assert time.perf_counter() - started < LARGE_N_BUDGET
+    assert is_derangement(values, LARGE_N)
+
+
+@pytest.mark.parametrize('n', [2, 3, 1000, 10 ** 5])
+def test_derangements_have_no_fixed_points(n):
+    rng = random.Random(n)
+    for _ in range(3):
+        assert is_derangement(random_derangement(n, rng), n)
+
+
+def test_single_element_has_no_derangement():
+    with pytest.raises(ValueError):
+        random_derangement(1)
+
+
+@pytest.mark.parametrize('n', [2, 3, 4, 5, 6])
+def test_matching_agrees_with_brute_force(n):
+    rng = random.Random(n)
+    pairs = [(i, j) for i in range(n) for j in range(n) if i != j]
+    for _ in range(200):
+        forbidden = set(rng.sample(pairs, rng.randrange(len(pairs) + 1)))
+        possible = any(is_derangement(p, n) and not any((i, j) in forbidden for i, j in enumerate(p))
+                       for p in itertools.permutations(range(n)))
+
+        for find in (lambda: _matching(n, forbidden, rng), lambda: constrained_derangement(n, forbidden, rng)):
+            if possible:
+                values = find()
+                assert is_derangement(values, n)
+                assert not any((i, j) in forbidden for i, j in enumerate(values))
+            else:
+                with pytest.raises(ValueError):
+                    find()
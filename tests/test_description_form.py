@@ -0,0 +1,63 @@
+import time
+
+from db_handler import db_session
+from forms import DescriptionForm
+from helper.generic_helper import build_description_form, description_form_class, get_cur_round
+from models import Participation, Question
+from test_backends import start_round
+
+BUILDS = 50
+# Seconds one form build may take on average whatever the number of old questions, a run took 0.003
+BUILD_BUDGET = 0.02
+
+
+def build_form(app):
+    with app.test_request_context():
+        cur_round = get_cur_round()
+        description = db_session.query(Participation).filter(Participation.round_id == cur_round.id).one().description
+        form = build_description_form(cur_round, description)
+        db_session.remove()
+        return form
+
+
+def test_form_classes_are_cached_per_question_set():
+    questions = ((1, 'Colour?', 'text'), (2, 'Picture?', 'image'))
+    form_class = description_form_class(1, questions)
+    assert description_form_class(1, questions) is form_class
+    assert issubclass(form_class, DescriptionForm)
+    assert not any(name.startswith('question_') for name in vars(DescriptionForm))
+
+    changed = description_form_class(1, ((1, 'Favourite colour?', 'text'), (2, 'Picture?', 'image')))
+    assert changed is not form_class
+    assert changed.question_1.args[0] == 'Favourite colour?'
+    assert description_form_class(1, questions[:1]) is not form_class
+
+
+def test_answers_prefill_the_form(admin_client, app):
+    colour, animal = start_round(admin_client, ['Colour?', 'Animal?'])
+    admin_client.post('/description', data={'question_{}'.format(colour): 'blue'})
+
+    form = build_form(app)
+    assert form['question_{}'.format(colour)].data == 'blue'
+    assert form['question_{}'.format(animal)].data is None
+
+
+def test_form_build_time_ignores_old_questions(admin_client, app, count_queries):
+    start_round(admin_client, ['Colour?', 'Animal?', 'Food?'])
+
+    statements = []
+    for history in (0, 500):
+        db_session.add_all([Question('Old question {}?'.format(index)) for index in range(history)])
+        db_session.commit()
+        db_session.remove()
+        build_form(app)
+
+        with count_queries() as counts:
+            started = time.perf_counter()
+            for _ in range(BUILDS):
+                build_form(app)
+            elapsed = time.perf_counter() - started
+        statements.append(len(counts['statements']))
+        assert elapsed / BUILDS < BUILD_BUDGET
+
+    assert statements[0] == statements[1]
@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Cumulative import time of main in seconds, generous so slow machines pass
+IMPORT_TIME_BUDGET = 1.5
+
+DEFERRED_MODULES = ['config', 'yaml', 'PIL', 'bcrypt', 'flask_mail']
+
+PROBE = '''
+import sys
+opened = []
+sys.addaudithook(lambda event, args: opened.append(args[0])
+                 if event == 'open' and 'secret_config' in str(args[0]) else None)
+import main
+print(opened)
+print([name for name in {} if name in sys.modules])
+'''.format(DEFERRED_MODULES)
+
+
+def run_python(*args):
+    # A bare environment, neither FLASK_CONFIG nor any secret is set
+    return subprocess.run([sys.executable] + list(args), cwd=ROOT, env={'PYTHONPATH': ROOT},
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+def test_import_defers_config_and_heavy_modules():
+    opened, loaded = run_python('-c', PROBE).stdout.splitlines()
+    assert opened == '[]'
+    assert loaded == '[]'
+
+
+def test_import_time():
+    stderr = run_python('-X', 'importtime', '-c', 'import main').stderr
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    cumulative = {line.split('|')[2].strip(): int(line.split('|')[1])
+                  for line in stderr.splitlines() if line.startswith('import time:') and '[us]' not in line}
+    assert cumulative['main'] / 1e6 < IMPORT_TIME_BUDGET
@@ -0,0 +1,85 @@
+from sqlalchemy import event, inspect, text
+
+import db_handler
+import migrations
+from db_handler import db_session
+from helper.generic_helper import get_answers
+from models import Question, Description, Answer
+
+ANSWERS = 100000
+QUESTIONS = 20
+LOOKUP_INDEX = 'ix_answers_description_question'
+
+
+def fill_answers():
+    questions = [Question('Question {}?'.format(index), 'text') for index in range(QUESTIONS)]
+    db_session.add_all(questions)
+    db_session.commit()
+    first_question = min(question.id for question in questions)
+
+    # Generated by the database, row by row inserts would dominate the test
+    db_session.execute(text(
+        'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count) '
+        'INSERT INTO descriptions (id) SELECT i FROM n'
+    ), {'count': ANSWERS // QUESTIONS})
+    db_session.execute(text(
+        'WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < :count) '
+        'INSERT INTO answers (description_id, question_id, text) '
+        'SELECT i / :questions + 1, i % :questions + :first_question, \'answer\' FROM n'
+    ), {'count': ANSWERS - 1, 'questions': QUESTIONS, 'first_question': first_question})
+    db_session.commit()
+    db_session.execute(text('ANALYZE'))
+    db_session.commit()
+    return [question.id for question in questions]
+
+
+def explain(statement, parameters):
+    connection = db_session.connection()
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(row[0] for row in connection.execute('EXPLAIN ' + statement, parameters))
+
+
+def test_answer_lookup_uses_the_index(app):
+    question_ids = fill_answers()
+    assert db_session.query(Answer).count() == ANSWERS
+
+    executed = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(db_handler.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        answers = get_answers([42, 4242], question_ids)
+    finally:
+        event.remove(db_handler.engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert {description_id: len(by_question) for description_id, by_question in answers.items()} == \
+        {42: QUESTIONS, 4242: QUESTIONS}
+    statement, parameters = executed[-1]
+    assert LOOKUP_INDEX in explain(statement, parameters)
+
+
+def test_lookup_index_migration_collapses_duplicates(app):
+    question = Question('Colour?', 'text')
+    other_question = Question('Animal?', 'text')
+    description = Description()
+    db_session.add_all([question, other_question, description])
+    db_session.commit()
+    question_id, other_question_id = question.id, other_question.id
+
+    db_session.execute(text('DROP INDEX {}'.format(LOOKUP_INDEX)))
+    for a_question_id, answer_text in [(question_id, 'old'), (other_question_id, 'owl'), (question_id, 'new')]:
+        db_session.execute(text(
+            'INSERT INTO answers (description_id, question_id, text) VALUES (:description, :question, :text)'
+        ), {'description': description.id, 'question': a_question_id, 'text': answer_text})
+    migrations.set_schema_version(db_session.connection(), 1)
+    db_session.commit()
+    db_session.remove()
+
+    assert migrations.migrate(db_handler.engine) == migrations.MIGRATIONS[-1][0]
+    assert {(answer.question_id, answer.text) for answer in db_session.query(Answer)} == \
+        {(question_id, 'new'), (other_question_id, 'owl')}
+    assert LOOKUP_INDEX in {index['name'] for index in inspect(db_handler.engine).get_indexes('answers')}
@@ -0,0 +1,148 @@
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import helper.mail_helper as mail_helper
+from db_handler import db_session
+from models import QueuedMail
+
+Controller = pytest.importorskip('aiosmtpd.controller').Controller
+
+REJECTED = 'bounce@example.org'
+BACKOFF = 30
+CLAIMERS = 4
+
+
+class RecordingHandler(object):
+    """SMTP server side which keeps the delivered mails and refuses REJECTED."""
+
+    def __init__(self):
+        self.deliveries = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == REJECTED:
+            return '550 5.1.1 Mailbox unavailable'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.deliveries.append((session.peer, envelope.rcpt_tos))
+        return '250 Message accepted for delivery'
+
+
+@pytest.fixture
+def smtp_server():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    controller = Controller(RecordingHandler(), hostname='127.0.0.1', port=port)
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture
+def app_config(smtp_server):
+    return {
+        'MAIL_SERVER': smtp_server.hostname,
+        'MAIL_PORT': smtp_server.port,
+        'MAIL_USERNAME': None,
+        'MAIL_PASSWORD': None,
+        'MAIL_USE_TLS': False,
+        'MAIL_USE_SSL': False,
+        'MAIL_SUPPRESS_SEND': False,
+        'MAIL_QUEUE_MAX_ATTEMPTS': 2,
+        'MAIL_QUEUE_BACKOFF': BACKOFF,
+        'MAIL_QUEUE_RATE_LIMIT': 0,
+    }
+
+
+@pytest.fixture
+def drain(app):
+    """Returns a function draining the queue once, in place of the worker which is stopped."""
+    worker = app.extensions['mail_worker']
+    worker.stop()
+    worker.join()
+
+    def drain_once():
+        with app.app_context():
+            try:
+                return mail_helper.drain_queue(app.extensions['mail'], app.config)
+            finally:
+                db_session.remove()
+
+    return drain_once
+
+
+def queue(*recipients):
+    mail_helper.send_mails([QueuedMail(recipient, 'Subject', '<p>Hello</p>') for recipient in recipients])
+    db_session.remove()
+
+
+def statuses():
+    result = {mail.recipient: mail for mail in db_session.query(QueuedMail)}
+    db_session.remove()
+    return result
+
+
+def test_batch_is_delivered_over_one_connection(drain, smtp_server):
+    recipients = ['user{}@example.org'.format(index) for index in range(3)]
+    queue(*recipients)
+
+    assert drain() == 3
+    deliveries = smtp_server.handler.deliveries
+    assert sorted(recipient for _, (recipient,) in deliveries) == recipients
+    assert len({peer for peer, _ in deliveries}) == 1
+    assert {mail.status for mail in statuses().values()} == {'sent'}
+
+
+def test_rejected_recipient_backs_off_until_failed(drain, smtp_server):
+    queue(REJECTED, 'user@example.org')
+
+    before = datetime.utcnow()
+    assert drain() == 2
+    mails = statuses()
+    assert mails['user@example.org'].status == 'sent'
+    rejected = mails[REJECTED]
+    assert (rejected.status, rejected.attempts) == ('queued', 1)
+    assert '550' in rejected.last_error
+    assert before + timedelta(seconds=BACKOFF) <= rejected.next_attempt_at <= \
+        datetime.utcnow() + timedelta(seconds=BACKOFF)
+
+    # Not due before its backoff is over
+    assert drain() == 0
+
+    db_session.query(QueuedMail).update({QueuedMail.next_attempt_at: datetime.utcnow()})
+    db_session.commit()
+    assert drain() == 1
+    rejected = statuses()[REJECTED]
+    assert (rejected.status, rejected.attempts) == ('failed', 2)
+    assert drain() == 0
+    assert len(smtp_server.handler.deliveries) == 1
+
+
+def test_concurrent_claims_are_disjoint(drain, app):
+    queue(*['user{}@example.org'.format(index) for index in range(100)])
+    claims = []
+    barrier = threading.Barrier(CLAIMERS)
+
+    def claim():
+        with app.app_context():
+            barrier.wait()
+            try:
+                claims.append([mail.id for mail in mail_helper.claim_mails(30, 300)])
+            finally:
+                db_session.remove()
+
+    threads = [threading.Thread(target=claim) for _ in range(CLAIMERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claims) == CLAIMERS
+    claimed = [mail_id for ids in claims for mail_id in ids]
+    assert len(claimed) == len(set(claimed)) > 0
+    assert {mail.id for mail in statuses().values() if mail.status == 'sending'} == set(claimed)
@@ -0,0 +1,47 @@
+import io
+import os
+import re
+
+import pytest
+
+import helper.media_helper as media_helper
+from test_backends import start_round
+
+Image = pytest.importorskip('PIL.Image')
+
+# CSS width of a gallery image, see the sizes attribute in description.html
+GALLERY_WIDTH = 700
+IMAGE_SIZE = (2400, 1600)
+
+
+def page_weight(html, upload_folder):
+    """Returns the bytes of all images a browser at GALLERY_WIDTH pixels loads for the page."""
+    weight = 0
+    for src, srcset in re.findall(r'<img [^>]*src="/uploads/([^"]+)"(?:\s+srcset="([^"]+)")?', html):
+        if srcset:
+            candidates = sorted((int(width), url) for url, width in re.findall(r'/uploads/(\S+) (\d+)w', srcset))
+            src = next((url for width, url in candidates if width >= GALLERY_WIDTH), candidates[-1][1])
+        weight += os.path.getsize(os.path.join(upload_folder, src))
+    return weight
+
+
+def test_renditions_reduce_the_gallery_page_weight(admin_client, app, monkeypatch):
+    question_id, = start_round(admin_client, ['Picture?'], q_type='image')
+    image = io.BytesIO()
+    Image.effect_noise(IMAGE_SIZE, 32).convert('RGB').save(image, format='PNG')
+    image.seek(0)
+
+    # Built below, once the page without renditions is measured
+    monkeypatch.setattr(media_helper, 'schedule_derivatives', lambda upload_folder, name: None)
+    admin_client.post('/description', content_type='multipart/form-data',
+                      data={'question_{}'.format(question_id): (image, 'picture.png')})
+    upload_folder = app.config['UPLOAD_FOLDER']
+    name, = [os.path.relpath(os.path.join(path, file_name), upload_folder)
+             for path, _, file_names in os.walk(upload_folder) for file_name in file_names]
+
+    before = page_weight(admin_client.get('/gallery').get_data(as_text=True), upload_folder)
+    assert before == os.path.getsize(os.path.join(upload_folder, name))
+
+    media_helper.build_derivatives(upload_folder, name, 'image')
+    after = page_weight(admin_client.get('/gallery').get_data(as_text=True), upload_folder)
+    assert after * 4 < before
@@ -0,0 +1,65 @@
+import time
+
+import password
+from conftest import signup
+from db_handler import db_session
+from models import User
+from password import PasswordHash, HashingPool
+
+ROUNDS = User.password.type.rounds
+# Lowest acceptable hashes per second of every path at the default cost factor
+MIN_THROUGHPUT = 1.0
+RUNS = 3
+
+
+def count_new_hashes(monkeypatch):
+    calls = []
+    new = PasswordHash.new
+
+    def counting_new(secret, rounds):
+        calls.append(rounds)
+        return new(secret, rounds)
+
+    monkeypatch.setattr(PasswordHash, 'new', counting_new)
+    return calls
+
+
+def test_hash_throughput_per_path(monkeypatch):
+    monkeypatch.setattr(password, 'hashing_pool', HashingPool(1, 0))
+    stored = PasswordHash.new('secret', ROUNDS)
+    paths = {
+        'signup': lambda: PasswordHash.new('secret', ROUNDS),
+        'login': lambda: stored.verify('secret'),
+        'failed login': lambda: stored.verify('wrong'),
+    }
+
+    for name, path in paths.items():
+        started = time.perf_counter()
+        for _ in range(RUNS):
+            path()
+        throughput = RUNS / (time.perf_counter() - started)
+        assert throughput >= MIN_THROUGHPUT, name
+
+    assert password.hashing_metrics()['completed'] == 1 + RUNS * len(paths)
+
+
+def test_signup_hashes_once(client, monkeypatch):
+    calls = count_new_hashes(monkeypatch)
+    assert signup(client, 'user@example.org').status_code == 302
+    assert calls == [ROUNDS]
+
+
+def test_login_rehashes_an_outdated_hash(app, monkeypatch):
+    user = User('user@example.org')
+    user.password = PasswordHash.new('secret', 4)
+    db_session.add(user)
+    db_session.commit()
+    db_session.remove()
+
+    calls = count_new_hashes(monkeypatch)
+    for _ in range(2):
+        response = app.test_client().post('/login', data={'email': 'user@example.org', 'password': 'secret'})
+        assert response.status_code == 302
+    # Only the first login finds the outdated hash
+    assert calls == [ROUNDS]
+    assert db_session.query(User).get('user@example.org').password.rounds == ROUNDS
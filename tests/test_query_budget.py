@@ -0,0 +1,54 @@
+from conftest import add_users
+from db_handler import db_session
+from models import Round, Question, Participation, Description, Answer
+from test_backends import start_round
+
+# Statements one admin page load may issue, whatever the size of the round
+ADMIN_QUERY_BUDGET = 8
+
+
+def add_participants(count, offset=0):
+    a_round = db_session.query(Round).filter(Round.running).one()
+    questions = db_session.query(Question).all()
+    emails = ['participant{}@example.org'.format(index) for index in range(offset, offset + count)]
+    add_users(emails)
+    for index, email in enumerate(emails):
+        description = Description(user_id=email)
+        db_session.add(Participation(cur_round=a_round, description=description, eligible=True))
+        # Every other participant leaves the last question open
+        for question in questions[:len(questions) - index % 2]:
+            db_session.add(Answer(description=description, question=question, text='answer'))
+    db_session.commit()
+    db_session.remove()
+
+
+def test_admin_query_budget(admin_client, count_queries):
+    start_round(admin_client, ['Colour?', 'Animal?', 'Food?'])
+
+    statements = []
+    for count, offset in [(5, 0), (45, 5)]:
+        add_participants(count, offset)
+        admin_client.get('/admin')
+        with count_queries() as counts:
+            assert admin_client.get('/admin').status_code == 200
+        statements.append(len(counts['statements']))
+
+    assert statements[0] == statements[1]
+    assert statements[1] <= ADMIN_QUERY_BUDGET
+
+
+def test_description_save_is_one_unit_of_work(admin_client, count_queries):
+    counts_by_size = {}
+    for size in (3, 30):
+        question_ids = start_round(admin_client, ['Question {} of {}'.format(index, size) for index in range(size)])
+        for save in ('insert', 'update'):
+            data = {'question_{}'.format(question_id): '{} {}'.format(save, question_id)
+                    for question_id in question_ids}
+            with count_queries() as counts:
+                assert admin_client.post('/description', data=data).status_code == 302
+            counts_by_size.setdefault(size, []).append((len(counts['statements']), counts['commits']))
+        admin_client.get('/edit_round/stop')
+
+    assert counts_by_size[3] == counts_by_size[30]
+    assert all(commits == 1 for statements, commits in counts_by_size[30])
+    assert db_session.query(Answer).filter(Answer.text.like('update %')).count() == 33
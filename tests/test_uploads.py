@@ -0,0 +1,55 @@
+import io
+import os
+
+from sqlalchemy import func
+
+from db_handler import db_session
+from models import Answer, Question
+from test_backends import start_round
+
+IMAGE = b'\x89PNG\r\n\x1a\n' + bytes(2048)
+
+
+def upload(client, question_id, filename, content=IMAGE):
+    return client.post('/description', content_type='multipart/form-data', data={
+        'question_{}'.format(question_id): (io.BytesIO(content), filename),
+    })
+
+
+def stored_files(app):
+    return [name for _, _, names in os.walk(app.config['UPLOAD_FOLDER']) for name in names]
+
+
+def test_oversized_upload_is_cut_off(admin_client, app, monkeypatch):
+    question_id, = start_round(admin_client, ['Picture?'], q_type='image')
+    # Keeps the test from building renditions of the stand-in image
+    monkeypatch.setattr('helper.media_helper.schedule_derivatives', lambda upload_folder, name: None)
+
+    app.config['MAX_IMAGE_SIZE'] = len(IMAGE) - 1
+    assert upload(admin_client, question_id, 'picture.png').status_code == 413
+    assert stored_files(app) == []
+
+    app.config['MAX_IMAGE_SIZE'] = len(IMAGE)
+    assert upload(admin_client, question_id, 'picture.png').status_code == 302
+    assert len(stored_files(app)) == 1
+    assert db_session.query(Answer.text).scalar().endswith('.png')
+
+
+def test_unsupported_upload_is_skipped(admin_client, app):
+    text_id, = start_round(admin_client, ['Colour?'])
+    admin_client.post('/add_question', data={'text': 'Picture?', 'q_type': 'image'})
+    image_id = db_session.query(func.max(Question.id)).scalar()
+    db_session.remove()
+    admin_client.get('/edit_question?action=use&id={}'.format(image_id))
+
+    for filename in ('tool.exe', 'README'):
+        response = admin_client.post('/description', content_type='multipart/form-data', data={
+            'question_{}'.format(text_id): 'blue',
+            'question_{}'.format(image_id): (io.BytesIO(IMAGE), filename),
+        })
+        assert response.status_code == 302
+        with admin_client.session_transaction() as session:
+            assert any(filename in message for _, message in session.pop('_flashes'))
+
+    assert {answer.question_id: answer.text for answer in db_session.query(Answer)} == {text_id: 'blue'}
+    assert stored_files(app) == []
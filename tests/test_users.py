@@ -0,0 +1,69 @@
+import threading
+from collections import Counter
+
+from conftest import add_users, login_as, signup
+from db_handler import db_session
+from main import reset_serializer
+from models import User
+from password import configure_hashing_pool
+
+SIGNUPS = 50
+
+
+def test_user_loader_is_cached(admin_client, count_queries):
+    admin_client.get('/')
+    with count_queries() as counts:
+        assert admin_client.get('/').status_code == 200
+    assert not any('FROM users' in statement for statement in counts['statements'])
+
+
+def test_admin_changes_are_revoked_at_once(admin_client, app):
+    add_users(['user@example.org'])
+    user_client = login_as(app.test_client(), 'user@example.org')
+    assert user_client.get('/admin').status_code == 302
+
+    admin_client.get('/edit_user?action=admin&mail=user@example.org')
+    assert user_client.get('/admin').status_code == 200
+
+    admin_client.get('/edit_user?action=admin&mail=user@example.org')
+    assert user_client.get('/admin').status_code == 302
+
+    admin_client.get('/edit_user?action=delete&mail=user@example.org')
+    response = user_client.get('/')
+    assert response.status_code == 302
+    assert response.location.endswith('/login')
+
+
+def test_password_reset_applies_to_the_next_login(client, app):
+    signup(client, 'user@example.org', 'old secret')
+    assert client.get('/').status_code == 200
+
+    with app.app_context():
+        token = reset_serializer().dumps('user@example.org', salt='reset-password-key')
+    client.post('/reset_password/{}'.format(token), data={'password': 'new secret', 'confirm': 'new secret'})
+
+    other = app.test_client()
+    assert other.post('/login', data={'email': 'user@example.org', 'password': 'old secret'}).status_code == 200
+    assert other.post('/login', data={'email': 'user@example.org', 'password': 'new secret'}).status_code == 302
+
+
+def test_racing_signups_create_one_admin(app):
+    # Room for every signup, the test is about the database and not about back-pressure
+    configure_hashing_pool(8, SIGNUPS)
+    statuses = Counter()
+    barrier = threading.Barrier(SIGNUPS)
+
+    def run_signup(index):
+        client = app.test_client()
+        barrier.wait()
+        statuses[signup(client, 'racer{}@example.org'.format(index)).status_code] += 1
+
+    threads = [threading.Thread(target=run_signup, args=(index,)) for index in range(SIGNUPS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == {302: SIGNUPS}
+    assert db_session.query(User).count() == SIGNUPS
+    assert db_session.query(User).filter(User.admin).count() == 1